@@ -0,0 +1,106 @@
+"""
+Headless batch solving of graph files, without the need for a display.
+Run with `python3 -m src.batch graph1.txt graph2.txt ...` in the root directory.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from functools import partial
+from multiprocessing import Pool
+from .graph_io import *
+from .tsp import *
+from .decomposition import *
+
+
+def solveFile(path, vidStart=1, engine='iterative', processes=None, decomposition='file', improveTime=0, memoryBudget=None,
+              checkpointDirectory=None, profileDirectory=None, compact=False):
+    """Solve the graph in a file, returns a (json serializable) dictionary with the results.
+    The tree decomposition is the one in the file, or it's computed with the decomposition heuristic
+    ('min-degree' or 'min-fill'), which is also used if the file doesn't contain a tree decomposition.
+    The DP tables are kept within the memory budget (in bytes) if one is given,
+    and they are written to (and reused from) the checkpoint directory if one is given.
+    If a profile directory is given, the counters per bag (<name>.json) and a Chrome trace (<name>.trace.json) are written there.
+    If compact is set, the graph is loaded as a CompactGraph, which uses much less memory for large graphs."""
+    result = {'file': path}
+    try:
+        startTime = time.perf_counter()
+        graph = readGraph(path, vidStart, compact)
+        result['name'] = graph.name
+        if decomposition != 'file' or len(graph.vertices) < 1:
+            heuristic = 'min-fill' if decomposition == 'file' else decomposition
+            graph, _ = treeDecomposition(graph.originalGraph, heuristic, improveTime)
+        result['width'] = decompositionWidth(graph)
+        solver = TSPSolver(graph, engine, processes, memoryBudget=memoryBudget, checkpointDirectory=checkpointDirectory,
+                           instrument=profileDirectory != None)
+        value, edges = solver.solve()
+        result['cost'] = value if value < sys.maxsize else None
+        result['tour'] = [vid + vidStart for vid in solver.tourVertices(edges)]
+        result['time'] = time.perf_counter() - startTime
+        result['states'] = solver.stateCount()
+        result['tables'] = solver.tables.report()
+        if profileDirectory != None:
+            result['counters'] = solver.stats.totals()
+            os.makedirs(profileDirectory, exist_ok=True)
+            name = os.path.join(profileDirectory, os.path.splitext(os.path.basename(path))[0])
+            solver.stats.writeJson(name + '.json')
+            solver.stats.writeChromeTrace(name + '.trace.json')
+    except Exception as e:
+        # One broken file shouldn't stop the entire batch
+        result['error'] = "{}: {}".format(type(e).__name__, e)
+    return result
+
+
+def solveFiles(paths, processes=None, engine='iterative', decomposition='file', improveTime=0, memoryBudget=None,
+               checkpointDirectory=None, profileDirectory=None, compact=False):
+    """Solve many graph files in a process pool, yields the results in order of completion"""
+    solve = partial(solveFile, engine=engine, decomposition=decomposition, improveTime=improveTime,
+                    memoryBudget=memoryBudget, checkpointDirectory=checkpointDirectory, profileDirectory=profileDirectory,
+                    compact=compact)
+    if engine == 'parallel':
+        # The parallel engine uses the process pool for the subtrees of one file, so solve the files one by one
+        for path in paths:
+            yield solve(path, processes=processes)
+        return
+    with Pool(processes) as pool:
+        yield from pool.imap_unordered(solve, paths)
+
+
+def main(argv=None):
+    """The entrypoint for the headless batch solver"""
+    parser = argparse.ArgumentParser(description="Solve TSP on many graph + tree decomposition files.")
+    parser.add_argument('paths', nargs='+', help="the graph files to solve")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="the number of processes (default: all cores)")
+    parser.add_argument('-e', '--engine', choices=['iterative', 'parallel', 'recursive', 'nice'],
+                        default='iterative', help="the DP engine to use (default: iterative)")
+    parser.add_argument('-d', '--decomposition', choices=['file', 'min-degree', 'min-fill'], default='file',
+                        help="use the tree decomposition from the file (min-fill if there is none) or compute one")
+    parser.add_argument('--improve', type=float, default=0, metavar='SECONDS',
+                        help="the time to spend on improving computed tree decompositions (default: 0)")
+    parser.add_argument('-m', '--memory', type=float, default=None, metavar='MB',
+                        help="the memory budget for the DP tables per process, larger tables are spilled to disk")
+    parser.add_argument('-c', '--checkpoints', default=None, metavar='DIRECTORY',
+                        help="write the DP tables to this directory and reuse the ones that are already there")
+    parser.add_argument('-p', '--profile', default=None, metavar='DIRECTORY',
+                        help="write the DP counters per bag and a Chrome trace of every file to this directory")
+    parser.add_argument('--compact', action='store_true',
+                        help="load the graphs into compact arrays, which uses much less memory for large graphs")
+    parser.add_argument('-o', '--output', default=None, help="the file to write the results to (default: stdout)")
+    args = parser.parse_args(argv)
+    memoryBudget = None if args.memory is None else int(args.memory * 1024 * 1024)
+
+    out = sys.stdout if args.output is None else open(args.output, 'w')
+    try:
+        # The results are written as json lines, one line per file
+        for result in solveFiles(args.paths, args.jobs, args.engine, args.decomposition, args.improve, memoryBudget,
+                                 args.checkpoints, args.profile, args.compact):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+A benchmark of the TSP solver on synthetic graphs of increasing sizes and widths.
+Run with `python3 -m src.benchmark` in the root directory.
+"""
+import sys
+import json
+import time
+import argparse
+from .graph_io import *
+from .generators import *
+from .tsp import *
+from .decomposition import *
+
+# The benchmark cases: (family, generator, arguments), the sizes and widths grow within every family
+CASES = [
+    ('grid', gridGraph, (2, 4)),
+    ('grid', gridGraph, (3, 3)),
+    ('grid', gridGraph, (2, 12)),
+    ('grid', gridGraph, (3, 8)),
+    ('grid', gridGraph, (4, 6)),
+    ('grid', gridGraph, (4, 12)),
+    ('ktree', kTreeGraph, (9, 2)),
+    ('ktree', kTreeGraph, (10, 3)),
+    ('ktree', kTreeGraph, (30, 2)),
+    ('ktree', kTreeGraph, (30, 3)),
+    ('ktree', kTreeGraph, (60, 3)),
+    ('ktree', kTreeGraph, (25, 4)),
+    ('euclidean', euclideanGraph, (10, 2)),
+    ('euclidean', euclideanGraph, (35, 2)),
+    ('euclidean', euclideanGraph, (10, 3)),
+    ('euclidean', euclideanGraph, (50, 2)),
+    ('series-parallel', seriesParallelGraph, (10,)),
+    ('series-parallel', seriesParallelGraph, (50,)),
+    ('series-parallel', seriesParallelGraph, (200,)),
+]
+# The largest number of vertices for which the cost is verified by brute force
+BRUTE_FORCE_LIMIT = 12
+# Phases that take less time (in seconds) are too noisy to compare with the baseline
+NOISE_FLOOR = 0.01
+
+
+def runCase(generator, args, seed=0, engine='iterative', repeat=1):
+    """Generate a graph and solve it, returns a (json serializable) dictionary with the results.
+    The load (parsing the graph in the text format), the tree decomposition (min-fill, for graphs without one)
+    and the table filling and tour reconstruction of the DP are timed separately, the best of repeat runs is kept."""
+    lines = list(graphLines(generator(*args, seed=seed), 0))
+    times = {'load': [], 'decomposition': [], 'table': [], 'reconstruct': []}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        graph = parseGraph(lines, 0)
+        times['load'].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        if len(graph.vertices) < 1:
+            graph, _ = treeDecomposition(graph.originalGraph, 'min-fill')
+        times['decomposition'].append(time.perf_counter() - start)
+        solver = TSPSolver(graph, engine)
+        start = time.perf_counter()
+        value = solver.solveTables()
+        times['table'].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        edges = solver.solveTour()
+        times['reconstruct'].append(time.perf_counter() - start)
+
+    result = {'name': graph.name, 'vertices': len(graph.originalGraph.vertices), 'width': decompositionWidth(graph),
+              'cost': value if value < sys.maxsize else None, 'states': solver.stateCount()}
+    result.update((phase, min(t)) for phase, t in times.items())
+    if len(graph.originalGraph.vertices) <= BRUTE_FORCE_LIMIT:
+        best = bruteForceCost(graph.originalGraph)
+        result['verified'] = value == best and (value == sys.maxsize or sum(e.cost for e in edges) == value)
+    return result
+
+def runBenchmark(families=None, seed=0, engine='iterative', repeat=1):
+    """Run the benchmark cases (of the given families), yields the results in order"""
+    for family, generator, args in CASES:
+        if families == None or family in families:
+            result = runCase(generator, args, seed, engine, repeat)
+            result['family'] = family
+            yield result
+
+def bruteForceCost(graph):
+    """The cost of the smallest tour (or sys.maxsize if there is none) with the Held-Karp DP over subsets,
+    which is exponential in the number of vertices, so only for small graphs"""
+    n = len(graph.vertices)
+    if n < 3:
+        return sys.maxsize
+    cost = [[graph.cost(a, b) for b in range(n)] for a in range(n)]
+    # best[(subset, v)]: the cheapest path from vertex 0 through all vertices in the subset (of 1..n-1), ending at v
+    best = {(1 << v, v): cost[0][v] for v in range(1, n) if cost[0][v] < sys.maxsize}
+    for size in range(2, n):
+        layer = {}
+        for (subset, v), value in best.items():
+            for w in range(1, n):
+                if not subset & (1 << w) and cost[v][w] < sys.maxsize:
+                    key = (subset | (1 << w), w)
+                    if value + cost[v][w] < layer.get(key, sys.maxsize):
+                        layer[key] = value + cost[v][w]
+        best = layer
+    return min((value + cost[v][0] for (_, v), value in best.items() if cost[v][0] < sys.maxsize), default=sys.maxsize)
+
+def compareResults(results, baseline, threshold=1.5):
+    """Compare the results with the baseline results (by name), returns a list of human readable regressions:
+    different costs or state counts, failed verifications and phases that became more than threshold times slower"""
+    baseline = {result['name']: result for result in baseline}
+    regressions = []
+    for result in results:
+        name, old = result['name'], baseline.get(result['name'])
+        if result.get('verified') == False:
+            regressions.append("{}: the cost {} is not the optimum".format(name, result['cost']))
+        if old == None:
+            continue
+        for key in ['cost', 'states']:
+            if result[key] != old[key]:
+                regressions.append("{}: {} changed from {} to {}".format(name, key, old[key], result[key]))
+        for phase in ['load', 'decomposition', 'table', 'reconstruct']:
+            if result[phase] > threshold * old[phase] and result[phase] > NOISE_FLOOR:
+                regressions.append("{}: {} took {:.4f}s instead of {:.4f}s ({:.1f}x)"
+                                   .format(name, phase, result[phase], old[phase], result[phase] / old[phase]))
+    return regressions
+
+
+def main(argv=None):
+    """The entrypoint for the benchmark"""
+    parser = argparse.ArgumentParser(description="Benchmark the TSP solver on synthetic graphs.")
+    parser.add_argument('-f', '--family', action='append', choices=sorted({family for family, _, _ in CASES}),
+                        help="only run the cases of this family (can be repeated)")
+    parser.add_argument('-e', '--engine', choices=['iterative', 'parallel', 'recursive', 'nice'],
+                        default='iterative', help="the DP engine to use (default: iterative)")
+    parser.add_argument('-r', '--repeat', type=int, default=3, help="the number of runs per case, the fastest counts (default: 3)")
+    parser.add_argument('-s', '--seed', type=int, default=0, help="the seed of the generators (default: 0)")
+    parser.add_argument('-b', '--baseline', default='benchmark-baseline.json',
+                        help="the baseline results to compare with (default: benchmark-baseline.json)")
+    parser.add_argument('-t', '--threshold', type=float, default=1.5,
+                        help="report phases that are this many times slower than the baseline (default: 1.5)")
+    parser.add_argument('--save', action='store_true', help="store the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    results = []
+    print("{:<24} {:>5} {:>5} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8}".format(
+        'name', 'n', 'width', 'cost', 'states', 'load', 'decomp', 'table', 'tour', 'verified'))
+    for result in runBenchmark(args.family, args.seed, args.engine, args.repeat):
+        print("{:<24} {:>5} {:>5} {:>8} {:>8} {:>8.4f} {:>8.4f} {:>8.4f} {:>8.4f} {:>8}".format(
+            result['name'], result['vertices'], result['width'], str(result['cost']), result['states'],
+            result['load'], result['decomposition'], result['table'], result['reconstruct'], str(result.get('verified', '-'))))
+        results.append(result)
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print("\nSaved the baseline to '{}'".format(args.baseline))
+        return
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print("\nThere is no baseline at '{}' (store one with --save)".format(args.baseline))
+        return
+    regressions = compareResults(results, baseline, args.threshold)
+    print("\n{} regressions compared to '{}'{}".format(len(regressions), args.baseline, ':' if regressions else ''))
+    for regression in regressions:
+        print("  " + regression)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
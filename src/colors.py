@@ -12,6 +12,7 @@ class Colors():
         self.helptext = '#575852'
         self.scroll = '#737373'
         self.scrollbg = '#20211b'
+        self.tour = '#f92672'
 
     def toTuple(self, color):
         """Convert a hexadecimal colour to a integer tuple"""
@@ -0,0 +1,201 @@
+"""
+This module contains algorithms that create or transform tree decompositions
+"""
+import time
+import heapq
+import random
+from .settings import Pos
+from .graph import *
+
+
+#
+# Nice tree decompositions
+#
+def niceTreeDecomposition(graph, rootBag=None):
+    """Create a nice tree decomposition of the same (original) graph, with the first bag as root.
+    All bags are either a leaf (no vertices, no children), introduce (one child, one vertex more),
+    forget (one child, one vertex less) or join bag (two children with the same vertices) and the root is empty."""
+    nice = TreeDecomposition(graph.originalGraph)
+    nice.name = graph.name
+    if rootBag == None:
+        rootBag = graph.vertices[0]
+    newBag = lambda vertices, pos: _addNiceBag(nice, vertices, pos)
+
+    # Root the original tree and walk it bottom up (in reversed pre-order), so all children are done before their parent
+    parents, order, stack = {rootBag.vid: None}, [], [rootBag]
+    while stack:
+        X = stack.pop()
+        order.append(X)
+        for e in X.edges:
+            if e.other(X).vid not in parents:
+                parents[e.other(X).vid] = X
+                stack.append(e.other(X))
+    tops = {} # The top bag of the nice subtree per original bag, these have the same vertices as the original bag
+    for X in reversed(order):
+        vertices = sorted(X.vertices, key=lambda v: v.vid)
+        kids = [e.other(X) for e in X.edges if e.other(X) != parents[X.vid]]
+        # Connect all children with a chain of forget bags followed by a chain of introduce bags
+        chainTops = []
+        for K in kids:
+            forgets = [v for v in tops[K.vid].vertices if v not in X.vertices]
+            introduces = [v for v in vertices if v not in K.vertices]
+            steps = len(forgets) + len(introduces)
+            current = tops[K.vid].vertices
+            below = tops[K.vid]
+            for i, v in enumerate(forgets + introduces):
+                current = [w for w in current if w != v] if i < len(forgets) else sorted(current + [v], key=lambda w: w.vid)
+                bag = newBag(current, K.pos + (X.pos - K.pos) * ((i + 1) / (steps + 1)))
+                nice.addEdge(bag.vid, below.vid, 1)
+                below = bag
+            chainTops.append(below)
+        # A leaf gets a chain of introduce bags, starting with an empty bag
+        if not kids:
+            below = newBag([], X.pos + (0, 40 * (len(vertices) + 1)))
+            for i in range(len(vertices)):
+                bag = newBag(vertices[:i + 1], X.pos + (0, 40 * (len(vertices) - i)))
+                nice.addEdge(bag.vid, below.vid, 1)
+                below = bag
+            chainTops.append(below)
+        # Multiple children are joined pairwise, with join bags in a balanced binary tree
+        while len(chainTops) > 1:
+            joined = []
+            for i in range(0, len(chainTops) - 1, 2):
+                bag = newBag(vertices, X.pos + (0, -20 * (len(chainTops) // 2)))
+                nice.addEdge(bag.vid, chainTops[i].vid, 1)
+                nice.addEdge(bag.vid, chainTops[i + 1].vid, 1)
+                joined.append(bag)
+            chainTops = joined + chainTops[len(chainTops) - len(chainTops) % 2:]
+        tops[X.vid] = chainTops[0]
+
+    # Forget all vertices of the original root one by one, ending with an empty root
+    below = tops[rootBag.vid]
+    vertices = below.vertices
+    for i, v in enumerate(list(vertices)):
+        vertices = vertices[1:]
+        bag = newBag(vertices, rootBag.pos + (0, -40 * (i + 1)))
+        nice.addEdge(bag.vid, below.vid, 1)
+        below = bag
+
+    # The bags were created bottom up, reverse them so the root is the first bag
+    nice.vertices.reverse()
+    for vid, bag in enumerate(nice.vertices):
+        bag.vid = vid
+    return nice
+
+def _addNiceBag(nice, vertices, pos):
+    # Add a bag with (a copy of) the given vertices to the nice tree decomposition
+    bag = Bag(nice, len(nice.vertices), Pos(pos.x, pos.y))
+    bag.vertices = list(vertices)
+    nice.addVertex(bag)
+    return bag
+
+
+#
+# Tree decomposition heuristics
+#
+def treeDecomposition(graph, heuristic='min-fill', improveTime=0, seed=None):
+    """Compute a tree decomposition of the (original) graph with an elimination ordering heuristic,
+    returns the tree decomposition and its width. The heuristic is either 'min-degree' or 'min-fill'.
+    If improveTime is positive, orderings with random tie breaking are tried for that many seconds
+    and the one with the smallest width (and estimated DP work) is used."""
+    if heuristic not in {'min-degree', 'min-fill'}:
+        raise ValueError("Unknown tree decomposition heuristic: '{}'".format(heuristic))
+    rnd = random.Random(seed)
+    bags, parents = _eliminate(graph, heuristic, None)
+    best = (_decompositionCost(bags), bags, parents)
+    endTime = time.perf_counter() + improveTime
+    while time.perf_counter() < endTime:
+        bags, parents = _eliminate(graph, heuristic, rnd)
+        best = min(best, (_decompositionCost(bags), bags, parents), key=lambda t: t[0])
+
+    # Create the actual tree decomposition, with the bags laid out in layers by their depth
+    _, bags, parents = best
+    td = TreeDecomposition(graph)
+    td.name = graph.name
+    depths, layers = {}, {}
+    for vid in reversed(list(bags)):
+        depths[vid] = 0 if parents[vid] == None else depths[parents[vid]] + 1
+        layers[depths[vid]] = layers.get(depths[vid], 0) + 1
+        bag = Bag(td, len(td.vertices), Pos(40 + 100 * (layers[depths[vid]] - 1), 40 + 100 * depths[vid]))
+        bag.vertices = [graph.vertices[w] for w in sorted(bags[vid])]
+        td.addVertex(bag)
+        bags[vid] = bag
+    for vid, parent in parents.items():
+        if parent != None:
+            td.addEdge(bags[vid].vid, bags[parent].vid, 1)
+    return td, decompositionWidth(td)
+
+def decompositionWidth(td):
+    """The width of a tree decomposition (the size of its largest bag minus one)"""
+    return max((len(bag.vertices) for bag in td.vertices), default=0) - 1
+
+def _decompositionCost(bags):
+    # The width of the decomposition, and the estimated DP work for ties
+    return (max((len(b) for b in bags.values()), default=0), sum(3 ** len(b) for b in bags.values()))
+
+def _eliminate(graph, heuristic, rnd):
+    # Eliminate the vertices in the order given by the heuristic (with random tie breaking if rnd is given).
+    #   Returns the bags (by vid of the eliminated vertex, in elimination order) and the parent (vid) of every bag,
+    #   bags that are a subset of a neighbouring bag are merged with it.
+    adjacency = {v.vid: {e.other(v).vid for e in v.edges} for v in graph.vertices}
+    # The fill-in (number of non adjacent pairs of neighbours) is kept up to date while eliminating
+    fill = {vid: sum(len(neighbours - adjacency[u]) - 1 for u in neighbours) // 2 for vid, neighbours in adjacency.items()}
+    score = (lambda vid: len(adjacency[vid])) if heuristic == 'min-degree' else (lambda vid: fill[vid])
+    tiebreak = (lambda vid: rnd.random()) if rnd else (lambda vid: vid)
+    scores = {vid: score(vid) for vid in adjacency}
+    heap = [(s, tiebreak(vid), vid) for vid, s in scores.items()]
+    heapq.heapify(heap)
+
+    bags, parents, eliminated = {}, {}, {}
+    while heap:
+        s, _, vid = heapq.heappop(heap)
+        if vid in eliminated or scores[vid] != s:
+            continue # An outdated heap entry
+        # Eliminate the vertex: remove it and make its neighbours a clique
+        eliminated[vid] = len(eliminated)
+        neighbours = adjacency.pop(vid)
+        bags[vid] = neighbours | {vid}
+        changed = set(neighbours)
+        for u in neighbours:
+            adjacency[u].discard(vid)
+            fill[u] -= len(adjacency[u] - neighbours)
+        for a in neighbours:
+            for b in neighbours - adjacency[a]:
+                if a < b:
+                    # The fill edge a-b: it's no longer missing for their common neighbours, but it adds new pairs for a and b
+                    common = adjacency[a] & adjacency[b]
+                    for w in common:
+                        fill[w] -= 1
+                    changed |= common
+                    fill[a] += len(adjacency[a] - adjacency[b])
+                    fill[b] += len(adjacency[b] - adjacency[a])
+                    adjacency[a].add(b)
+                    adjacency[b].add(a)
+        for u in changed:
+            if scores[u] != score(u):
+                scores[u] = score(u)
+                heapq.heappush(heap, (scores[u], tiebreak(u), u))
+
+    # The parent of a bag is the bag of its neighbour that is eliminated first,
+    #   bags without such a neighbour (one per connected component) are connected to the last bag.
+    order = list(bags)
+    for vid in order:
+        later = bags[vid] - {vid}
+        parents[vid] = min(later, key=lambda u: eliminated[u]) if later else None
+    for vid in order[:-1]:
+        if parents[vid] == None:
+            parents[vid] = order[-1]
+
+    # Merge bags into their parent if one of them is a subset of the other (the parent keeps the largest set)
+    merged = {}
+    def find(vid):
+        while vid in merged:
+            vid = merged[vid]
+        return vid
+    for vid in order[:-1]:
+        parent = find(parents[vid])
+        if bags[vid] <= bags[parent] or bags[parent] <= bags[vid]:
+            bags[parent] = bags[parent] | bags[vid]
+            merged[vid] = parent
+    result = {vid: bags[vid] for vid in order if vid not in merged}
+    return result, {vid: None if parents[vid] == None else find(parents[vid]) for vid in result}
@@ -0,0 +1,205 @@
+"""
+This module contains the draw methods of the windows, which don't depend on how (and on what) the items are drawn.
+Only the windows that draw on a Tk canvas import tkinter, so graphs can be drawn without a display.
+"""
+import math
+from .settings import *
+from .graph import *
+
+
+class Drawing():
+    """The draw methods of a window, on top of drawItem and eraseItem, which draw on the actual surface.
+    Items drawn with a key may be kept between frames by the surface, the key identifies them."""
+
+    def drawItem(self, key, kind, coords, **options):
+        """Draw an item of a kind of canvas item ('line', 'oval', 'rectangle' or 'text') at the coordinates"""
+        raise NotImplementedError()
+
+    def eraseItem(self, key):
+        """Erase the item with this key, if it was drawn"""
+        raise NotImplementedError()
+
+    def drawString(self, text, c, p, anchor='nw', key=None, **kwargs):
+        self.drawItem(key, 'text', (self.pos + p).t, anchor=anchor, text=text, fill=c, font=self.settings.font, **kwargs)
+
+    def drawLine(self, c, p, q, w=1, key=None, **kwargs):
+        self.drawItem(key, 'line', (self.pos + p).t + (self.pos + q).t, fill=c, **kwargs)
+        # TODO: Use width
+    def drawHorizontalLine(self, c, h, w=1):
+        self.drawLine(c, Pos(0, h), Pos(self.size.w, h), w)
+
+    def drawRect(self, c, p, s, key=None, **kwargs):
+        self.drawRectBorder(c, p, s, 0, key, **kwargs)
+    def drawRectBorder(self, c, p, s, borderw=1, key=None, **kwargs):
+        self.drawItem(key, 'rectangle', (self.pos + p).t + (self.pos + p + s).t, fill=c, width=borderw, **kwargs)
+    def drawDisc(self, c, p, r, key=None, **kwargs):
+        self.drawItem(key, 'oval', (p.x-r, p.y-r, p.x+r, p.y+r), fill=c, outline="", **kwargs)
+
+
+class GraphDrawing(Drawing):
+    """Draws a graph (and its tree decomposition) like in the main window, with the graph, the selected and hovered
+    vertices of self.graphInteraction, scaled by self.scaleFactor. Selected vertices are drawn at the dragOffset."""
+
+    @property
+    def isTreeDecomposition(self):
+        return self.graphInteraction.isTreeDecomposition
+
+    @property
+    def dragOffset(self):
+        return self.mousePos - self.mouseDownStartPos if self.mouseDownButton == 1 else Pos(0, 0)
+
+    def onScreen(self, p, q=None):
+        """Whether the position (or the line from p to q) can be seen, with a margin for the radius of the vertices"""
+        q = q or p
+        margin = self.settings.vertexradiusbig + self.settings.bagextra
+        return -margin <= max(p.x, q.x) and min(p.x, q.x) <= self.size.w + margin \
+            and -margin <= max(p.y, q.y) and min(p.y, q.y) <= self.size.h + margin
+
+    def drawGraph(self, graph, layer):
+        """Draw the visible part of the graph, with the vertices in dense regions clustered when there are too many"""
+        # The offset for selected vertices
+        selectedVs = set(self.graphInteraction.selectedVertices)
+        offset = self.dragOffset
+        screenPos = lambda v: v.pos * self.scaleFactor + offset if v in selectedVs else v.pos * self.scaleFactor
+        visible = [v for v in graph.vertices if v != None and self.onScreen(screenPos(v))]
+        clusters = None
+        if len(visible) > self.settings.clusterlimit:
+            clusters = self.clusterVertices(visible, screenPos, layer)
+        self.clustered = self.clustered or clusters != None
+
+        # Draw all edges
+        if clusters == None:
+            for v in graph.vertices:
+                if v != None:
+                    for e in v.edges:
+                        if v.vid < e.other(v).vid:
+                            self.drawEdge(v, e.other(v), e, selectedVs, offset, layer)
+        else:
+            # One line between every two neighbouring clusters (or vertices that are not in a cluster)
+            cellOf, centre, sizes = clusters
+            drawn = set()
+            for v in graph.vertices:
+                if v != None:
+                    for w in (e.other(v) for e in v.edges):
+                        ca, cb = cellOf.get(v, ('vertex', v)), cellOf.get(w, ('vertex', w))
+                        pa = centre[ca] if ca in centre else screenPos(v)
+                        pb = centre[cb] if cb in centre else screenPos(w)
+                        pair = frozenset((ca, cb))
+                        if ca == cb or pair in drawn or not self.onScreen(pa, pb):
+                            continue
+                        drawn.add(pair)
+                        self.drawLine(self.colors.edge, pa, pb, key=('edge', pair), tags=(layer + ' edge',))
+
+        if self.settings.drawsize > 0:
+            # Draw the hovered vertex and the visible vertices, with their text only if it doesn't overlap other vertices
+            self.drawHover(graph, layer)
+            if clusters == None:
+                crowded = self.crowdedVertices(visible, screenPos, 2 * self.settings.fontsize.h) if self.settings.drawsize > 1 else set()
+                for v in visible:
+                    self.drawVertex(v, selectedVs, offset, layer, v not in crowded)
+            else:
+                cellOf, centre, sizes = clusters
+                for cell, p in centre.items():
+                    if cell[0] == 'cluster':
+                        self.drawCluster(cell, p, sizes[cell], layer)
+                    else:
+                        self.drawVertex(cell[1], selectedVs, offset, layer, False)
+
+    def crowdedVertices(self, vertices, screenPos, space):
+        """The vertices that are too close to another vertex on the screen to draw their text"""
+        cells = {}
+        for v in vertices:
+            p = screenPos(v)
+            cells.setdefault((int(p.x // space), int(p.y // space)), []).append((v, p))
+        crowded = set()
+        for (x, y), vps in cells.items():
+            if len(vps) > 1:
+                crowded.update(v for v, p in vps)
+                continue
+            v, p = vps[0]
+            if any(p.distanceSqTo(q) < space * space for dx in [-1, 0, 1] for dy in [-1, 0, 1] if dx or dy
+                    for w, q in cells.get((x + dx, y + dy), [])):
+                crowded.add(v)
+        return crowded
+
+    def clusterVertices(self, vertices, screenPos, layer):
+        """Group the vertices by the square (of clustersize px) on the screen they are in. Returns the cluster of every
+        vertex in a square with others, the centre of every cluster (or the position of a vertex that is alone) and
+        the number of vertices in every cluster."""
+        cells = {}
+        for v in vertices:
+            p = screenPos(v)
+            cells.setdefault(('cluster', layer, int(p.x // self.settings.clustersize), int(p.y // self.settings.clustersize)), []).append(v)
+        cellOf, centre, sizes = {}, {}, {}
+        for cell, vs in cells.items():
+            if len(vs) == 1:
+                centre[('vertex', vs[0])] = screenPos(vs[0])
+                continue
+            centre[cell] = (1 / len(vs)) * sum((screenPos(v) for v in vs), Pos(0, 0))
+            sizes[cell] = len(vs)
+            for v in vs:
+                cellOf[v] = cell
+        return cellOf, centre, sizes
+
+    def drawCluster(self, cell, p, size, layer):
+        """Draw a disc for a cluster of vertices, larger for more vertices, with the number of vertices if it fits"""
+        r = min(self.settings.vertexradiussmall + 2 * math.log2(size), self.settings.clustersize)
+        self.drawDisc(self.colors.normal, p, r, key=('vertex', cell), tags=(layer + ' vertex',))
+        if self.settings.drawsize > 1 and len(str(size)) * self.settings.fontsize.w <= 2 * r:
+            self.drawString(str(size), self.colors.selectedtext, p, 'c', key=('label', cell), tags=(layer + ' label',))
+
+    def drawEdge(self, v, w, e, selectedVs, offset, layer=None):
+        """Draw the edge between v and w if it can be seen (and its cost, if it fits next to it)"""
+        a, b = (v, w) if v.vid < w.vid else (w, v)
+        layer = layer or ('graph' if type(v) == Bag or not self.isTreeDecomposition else 'original')
+        tags = (layer + ' edge', 'selected') if a in selectedVs and b in selectedVs else (layer + ' edge',)
+        ofsA = offset if a in selectedVs else Pos(0, 0)
+        ofsB = offset if b in selectedVs else Pos(0, 0)
+        pa, pb = a.pos * self.scaleFactor + ofsA, b.pos * self.scaleFactor + ofsB
+        if not self.onScreen(pa, pb):
+            self.eraseItem(('edge', a, b))
+            self.eraseItem(('cost', a, b))
+            return
+        self.drawLine(self.colors.edge, pa, pb, key=('edge', a, b), tags=tags)
+        anchor = "nw" if (pa.x < pb.x) != (pa.y < pb.y) else "ne"
+        text = str(e.cost)
+        if self.settings.drawsize > 0 and type(a.graph) != TreeDecomposition \
+                and pa.distanceTo(pb) >= (len(text) + 2) * self.settings.fontsize.w:
+            tags = (layer + ' cost',) + tags[1:]
+            self.drawString(text, self.colors.hover, 0.5 * (pa + pb) + (0, 2), anchor, key=('cost', a, b), tags=tags)
+        else:
+            self.eraseItem(('cost', a, b))
+
+    def drawHover(self, graph, layer):
+        """Draw the disc behind the hovered vertex if it is in this graph, returns whether it is"""
+        hoverVertex = self.graphInteraction.hoverVertex
+        isBag = type(hoverVertex) == Bag
+        if self.settings.drawsize == 0 or not hoverVertex or (type(graph) == TreeDecomposition) != isBag:
+            return False
+        r = self.settings.selectradius + (self.settings.bagextra if isBag else 0)
+        ofs = self.dragOffset if hoverVertex in self.graphInteraction.selectedVertices else Pos(0, 0)
+        self.drawDisc(self.colors.hover, hoverVertex.pos * self.scaleFactor + ofs, r, key='hover', tags=(layer + ' hover',))
+        return True
+
+    def drawVertex(self, v, selectedVs, offset, layer, drawText=True):
+        """Draw the disc and the text of a vertex"""
+        # Draw the disc
+        isBag = type(v) == Bag
+        c = self.colors.normal if self.settings.drawsize == 1 else self.colors.hover
+        c = self.colors.selected if v in selectedVs else c
+        r = self.settings.vertexradiussmall if self.settings.drawsize == 1 else self.settings.vertexradiusbig
+        if isBag: r += self.settings.bagextra
+        ofs = offset if v in selectedVs else Pos(0, 0)
+        tags = (layer + ' vertex', 'selected') if v in selectedVs else (layer + ' vertex',)
+        self.drawDisc(c, v.pos * self.scaleFactor + ofs, r, key=('vertex', v), tags=tags)
+
+        # Draw the text
+        if self.settings.drawsize > 1 and drawText:
+            f = (lambda x: chr(x.vid + ord('a'))) if self.settings.drawtext else lambda x: str(x.vid)
+            bagText = ""
+            if isBag:
+                bagText = "\n" if not v.parent else ("\nparent: " + f(v.parent) + "\n")
+                bagText += "v: " + ' '.join(map(f, v.vertices))
+            c = self.colors.selectedtext if v in selectedVs else self.colors.text
+            tags = (layer + ' label',) + tags[1:]
+            self.drawString(f(v) + bagText, c, v.pos * self.scaleFactor + ofs, 'c', key=('label', v), tags=tags)
@@ -0,0 +1,126 @@
+"""
+This module contains seeded generators of synthetic graphs (with a tree decomposition if they have a natural one)
+"""
+import math
+import random
+from .settings import Pos
+from .graph import *
+
+
+def gridGraph(width, height, seed=None, maxCost=50):
+    """A width x height grid with random edge costs, with the path decomposition that slides a window of width + 1
+    vertices over the rows (so its width is the width of the grid)"""
+    rnd = random.Random(seed)
+    graph = Graph(False)
+    for vid in range(width * height):
+        graph.addVertex(Vertex(graph, vid, Pos(40 + 60 * (vid % width), 40 + 60 * (vid // width))))
+    for vid in range(width * height):
+        if vid % width < width - 1:
+            graph.addEdge(vid, vid + 1, rnd.randint(1, maxCost))
+        if vid + width < width * height:
+            graph.addEdge(vid, vid + width, rnd.randint(1, maxCost))
+    n = width * height
+    bags = [list(range(i, min(n, i + width + 1))) for i in range(max(1, n - width))]
+    return _withBags(graph, bags, [None] + list(range(len(bags) - 1)), 'grid-{}x{}-{}'.format(width, height, seed))
+
+def kTreeGraph(n, k, seed=None, removeChance=0.2, maxCost=50):
+    """A random partial k-tree with n vertices: a k-tree where every edge is removed with the given chance,
+    with the natural tree decomposition of the k-tree (one bag per clique of k + 1 vertices).
+    For k > 1 a tour is planted: every new vertex is inserted between two consecutive vertices of the tour,
+    and the edges of the tour are never removed."""
+    rnd = random.Random(seed)
+    graph = _randomVertices(n, rnd)
+    k = min(k, n - 1)
+    bags, parents = [list(range(k + 1))], [None]
+    edges = [(a, b) for a in range(k + 1) for b in range(a + 1, k + 1)]
+    # The next vertex on the tour and the bag that contains both of them, for every vertex
+    successors = {vid: (vid + 1) % (k + 1) for vid in range(k + 1)}
+    bagOf = dict.fromkeys(successors, 0)
+    # Every new vertex is connected to k vertices of a clique, which forms a new clique with them
+    for vid in range(k + 1, n):
+        if k > 1:
+            u = rnd.randrange(vid)
+            parent, keep = bagOf[u], {u, successors[u]}
+        else:
+            parent, keep = rnd.randrange(len(bags)), set()
+        base = list(bags[parent])
+        del base[rnd.choice([i for i, w in enumerate(base) if w not in keep])]
+        edges += [(w, vid) for w in base]
+        bags.append(base + [vid])
+        parents.append(parent)
+        if k > 1:
+            successors[u], successors[vid] = vid, successors[u]
+            bagOf[u] = bagOf[vid] = len(bags) - 1
+    tour = {(u, v) for u, v in successors.items()} | {(v, u) for u, v in successors.items()} if k > 1 else set()
+    for a, b in edges:
+        if (a, b) in tour or rnd.random() >= removeChance:
+            graph.addEdge(a, b, rnd.randint(1, maxCost))
+    return _withBags(graph, bags, parents, 'ktree-{}-{}-{}'.format(n, k, seed))
+
+def euclideanGraph(n, neighbours=3, seed=None, size=800):
+    """A random Euclidean graph: n random points where every point is connected to its nearest neighbours,
+    the costs are the distances. So that it has a tour, the points are also connected in the order of their angle
+    around the center. It has no natural tree decomposition, so it's returned without bags."""
+    rnd = random.Random(seed)
+    graph = Graph(True)
+    for vid in range(n):
+        graph.addVertex(Vertex(graph, vid, Pos(rnd.randrange(size), rnd.randrange(size))))
+    center = Pos(size / 2, size / 2)
+    polygon = sorted(graph.vertices, key=lambda v: math.atan2(v.pos.y - center.y, v.pos.x - center.x))
+    for i, v in enumerate(polygon):
+        graph.addEdge(v.vid, polygon[i - 1].vid)
+    for v in graph.vertices:
+        others = sorted((w for w in graph.vertices if w != v), key=lambda w: v.pos.distanceSqTo(w.pos))
+        for w in others[:neighbours]:
+            graph.addEdge(v.vid, w.vid)
+    return _withBags(graph, [], [], 'euclidean-{}-{}-{}'.format(n, neighbours, seed))
+
+def seriesParallelGraph(n, seed=None, seriesChance=0.5, maxCost=50):
+    """A random series-parallel graph with n vertices, grown from a triangle by replacing a random edge u-v of
+    the tour by a path u-w-v (series) or by adding such a path next to it (parallel), so it always has a tour.
+    Every step adds a bag {u, v, w} below the bag that contains u-v, so this is a tree decomposition of width 2."""
+    rnd = random.Random(seed)
+    graph = _randomVertices(n, rnd)
+    costs = {(0, 1): rnd.randint(1, maxCost), (1, 2): rnd.randint(1, maxCost), (0, 2): rnd.randint(1, maxCost)}
+    bags, parents = [[0, 1, 2][:n]], [None]
+    tour = [(0, 1), (1, 2), (0, 2)]
+    bagOf = dict.fromkeys(tour, 0) # The bag containing the endpoints of every edge of the tour
+    for w in range(3, n):
+        u, v = tour.pop(rnd.randrange(len(tour)))
+        bags.append([u, v, w])
+        parents.append(bagOf.pop((u, v)))
+        if rnd.random() < seriesChance:
+            del costs[u, v]
+        for edge in [(u, w), (v, w)]:
+            costs[edge] = rnd.randint(1, maxCost)
+            bagOf[edge] = len(bags) - 1
+            tour.append(edge)
+    for (a, b), cost in sorted(costs.items()):
+        if b < n:
+            graph.addEdge(a, b, cost)
+    return _withBags(graph, bags, parents, 'series-parallel-{}-{}'.format(n, seed))
+
+def _randomVertices(n, rnd, size=800):
+    # A graph with n vertices at random positions
+    graph = Graph(False)
+    for vid in range(n):
+        graph.addVertex(Vertex(graph, vid, Pos(40 + rnd.randrange(size), 40 + rnd.randrange(size))))
+    return graph
+
+def _withBags(graph, bags, parents, name):
+    # The tree decomposition of the graph with the given bags (lists of vids) and the parent (index) of every bag,
+    #   the bags are laid out in layers by their depth
+    graph.name = name
+    td = TreeDecomposition(graph)
+    td.name = name
+    depths, layers = {}, {}
+    for i, vids in enumerate(bags):
+        depths[i] = 0 if parents[i] == None else depths[parents[i]] + 1
+        layers[depths[i]] = layers.get(depths[i], 0) + 1
+        bag = Bag(td, i, Pos(40 + 100 * (layers[depths[i]] - 1), 40 + 100 * depths[i]))
+        bag.vertices = [graph.vertices[vid] for vid in sorted(vids)]
+        td.addVertex(bag)
+    for i, parent in enumerate(parents):
+        if parent != None:
+            td.addEdge(i, parent, 1)
+    return td
@@ -1,7 +1,12 @@
 """
 This module contains my graph datastructures
 """
+import sys
+import math
+from array import array
+from bisect import bisect_left
 from .settings import *
+from .spatial import SpatialIndex
 
 
 #
@@ -13,7 +18,38 @@ class GraphBase():
         self.vertices = []
         self.isEuclidean = euclidean
         self.name = ""
-        pass
+        self.spatialIndex = None # The index of the vertex positions, built by the first nearestVertex
+        self.clearChanges()
+
+    def clearChanges(self):
+        """Forget the edits so far. The edits are tracked so that (for example) the DP only redoes the parts they affect."""
+        self.changedEdges = set() # The (sorted) vid pairs of the edges that are added, removed or got another cost
+        self.changedVertices = set() # The vids of the vertices whose contents changed (the vertex list of a bag)
+        self.structureChanged = False # Whether vertices were added or removed, which can change the vids
+
+    def edgeChanged(self, vidA, vidB):
+        """Register that the edge between these vertices is added, removed or got another cost"""
+        self.changedEdges.add((vidA, vidB) if vidA < vidB else (vidB, vidA))
+
+    def nearestVertex(self, pos, radius):
+        """The vertex closest to pos that is less than radius away (or None). The first call builds a spatial index
+        (with cells of this radius), which is kept up to date when vertices are added, removed or moved."""
+        if self.spatialIndex == None:
+            self.spatialIndex = SpatialIndex(radius)
+            for v in self.vertices:
+                if v != None:
+                    self.spatialIndex.add(v, v.pos)
+        return self.spatialIndex.nearest(pos, radius)
+
+    def vertexAdded(self, vertex):
+        # Keep the spatial index up to date
+        if self.spatialIndex != None:
+            self.spatialIndex.add(vertex, vertex.pos)
+
+    def vertexMoved(self, vertex):
+        # Keep the spatial index up to date
+        if self.spatialIndex != None:
+            self.spatialIndex.move(vertex, vertex.pos)
 
     def cost(self, vidA, vidB):
         raise NotImplementedError("Cost method is not implemented")
@@ -23,17 +59,43 @@ class GraphBase():
         if vertex.vid != len(self.vertices):
             return False
         self.vertices.append(vertex)
+        self.vertexAdded(vertex)
+        self.structureChanged = True
         return True
 
-    def removeVertex(self, vertex):
-        """Remove a vertex and fix edges and vids"""
-        assert self.vertices[vertex.vid].vid == vertex.vid
-        edgeCopy = vertex.edges.copy()
-        for e in edgeCopy:
+    def removeVertex(self, vertex, compact=True):
+        """Remove a vertex and its edges. Its place in the vertex list is kept (as None, a tombstone) until the next
+        compact, which fixes the vids. So to remove many vertices, remove them with compact=False and compact once
+        (or use removeVertices); the vertex objects stay valid handles, but their vids change on compaction."""
+        assert self.vertices[vertex.vid] is vertex
+        for e in list(vertex.edges):
             self.removeEdge(vertex.vid, e.other(vertex).vid)
-        del self.vertices[vertex.vid]
-        for i, v in enumerate(self.vertices):
-            v.vid = i
+        self.vertices[vertex.vid] = None
+        if self.spatialIndex != None:
+            self.spatialIndex.remove(vertex)
+        self.structureChanged = True
+        if compact:
+            self.compact()
+
+    def removeVertices(self, vertices):
+        """Remove many vertices at once, returns the new vid of every remaining vertex whose vid changed (see compact)"""
+        for v in vertices:
+            self.removeVertex(v, False)
+        return self.compact()
+
+    def compact(self):
+        """Remove the tombstones of the removed vertices by renumbering the vertices after them, in one pass.
+        Returns the new vid of every vertex whose vid changed (by old vid), to remap data that is keyed by vid."""
+        if None not in self.vertices:
+            return {}
+        remap, vertices = {}, []
+        for v in self.vertices:
+            if v != None:
+                if v.vid != len(vertices):
+                    remap[v.vid] = v.vid = len(vertices)
+                vertices.append(v)
+        self.vertices = vertices
+        return remap
 
     def addEdge(self, vidA, vidB, cost=0):
         raise NotImplementedError("Adding edges is not implemented")
@@ -48,7 +110,7 @@ class Graph(GraphBase):
         GraphBase.__init__(self, euclidean)
 
     def cost(self, vidA, vidB):
-        edge = self.vertices[vidA].getEdgeTo(vidB)
+        edge = self.vertices[vidA].adjacent.get(self.vertices[vidB])
         if edge != None:
             return edge.cost
         return sys.maxsize
@@ -66,14 +128,15 @@ class Graph(GraphBase):
             result = True
         if edge.b.addEdge(edge):
             result = True
+        if result:
+            self.edgeChanged(vidA, vidB)
         return result
 
     def removeEdge(self, vidA, vidB):
         a, b = [self.vertices[vid] for vid in [vidA, vidB]]
-        e = a.getEdgeTo(vidB)
-        a.edges.remove(e)
-        e = b.getEdgeTo(vidA)
-        b.edges.remove(e)
+        del a.adjacent[b]
+        del b.adjacent[a]
+        self.edgeChanged(vidA, vidB)
 
 
 class TreeDecomposition(Graph):
@@ -85,6 +148,8 @@ class TreeDecomposition(Graph):
     def addVertex(self, v):
         if type(v) is Bag: # , "Added vertex must be of type 'Bag'"
             self.vertices.append(v)
+            self.vertexAdded(v)
+            self.structureChanged = True
             return True
         elif type(v) is Vertex:
             return self.originalGraph.addVertex(v)
@@ -92,6 +157,315 @@ class TreeDecomposition(Graph):
             raise TypeError("Added vertex must be of type 'Vertex' or 'Bag'")
 
 
+class CompactGraph(GraphBase):
+    """A graph type for large graphs that stores everything in contiguous arrays: the coordinates per vertex and the
+    edges as a CSR adjacency, the (sorted) neighbours of vertex vid are neighbours[offsets[vid]:offsets[vid + 1]]
+    and their (32 bit) costs are at the same indices in costs. Every edge is stored once in both directions.
+    The vertices and edges are lightweight views on these arrays (see CompactVertex), created when accessed.
+    Adding or removing a single edge or vertex shifts the arrays, so use addEdges for bulk loading."""
+    def __init__(self, euclidean=False):
+        GraphBase.__init__(self, euclidean)
+        self.vertices = CompactVertices(self)
+        self.xs, self.ys = array('d'), array('d')
+        self.offsets = array('q', [0])
+        self.neighbours = array('i')
+        self.costs = array('i')
+        self.removed = set() # The vids of the removed vertices, until the next compact
+
+    def __len__(self):
+        return len(self.xs)
+
+    def cost(self, vidA, vidB):
+        i = self.edgeIndex(vidA, vidB)
+        return sys.maxsize if i == None else self.costs[i]
+
+    def edgeIndex(self, vidA, vidB):
+        """The index of vidB in the neighbours (and costs) of vidA, or None if they're not adjacent"""
+        lo, hi = self.offsets[vidA], self.offsets[vidA + 1]
+        i = bisect_left(self.neighbours, vidB, lo, hi)
+        return i if i < hi and self.neighbours[i] == vidB else None
+
+    def edgesOf(self, v):
+        """The edges of a vertex (view), see CompactVertex.edges"""
+        return [Edge(v, CompactVertex(self, self.neighbours[i]), self.costs[i])
+                for i in range(self.offsets[v.vid], self.offsets[v.vid + 1])]
+
+    def edgeTo(self, v, vid):
+        """The edge from a vertex (view) to the vertex with vertex-id 'vid', or None"""
+        i = self.edgeIndex(v.vid, vid)
+        return None if i == None else Edge(v, CompactVertex(self, vid), self.costs[i])
+
+    def edgeCost(self, vidA, vidB, cost=None):
+        # The cost of a new edge, computed from the coordinates if it isn't given (in Euclidean graphs)
+        if cost != None:
+            return cost
+        if not self.isEuclidean:
+            return 1
+        x, y = self.xs[vidA] - self.xs[vidB], self.ys[vidA] - self.ys[vidB]
+        return int(((x*x + y*y) ** 0.5) // 10) # The euclidean distance in deci-px, like Edge.euclideanCost
+
+    def addVertex(self, v):
+        """Add a vertex (any vertex with the next vid and a position), the graph only stores its position"""
+        if v.vid != len(self.xs):
+            return False
+        self.xs.append(v.pos.x)
+        self.ys.append(v.pos.y)
+        self.offsets.append(self.offsets[-1])
+        self.vertexAdded(CompactVertex(self, v.vid))
+        self.structureChanged = True
+        return True
+
+    def removeVertex(self, vertex, compact=True):
+        """Remove a vertex and its edges. Until the next compact, its vid is only marked as removed (its edges are
+        still in the arrays), compact rebuilds the arrays and fixes the vids. Views are outdated after compaction."""
+        vid = vertex.vid
+        assert 0 <= vid < len(self.xs) and vid not in self.removed
+        for w in self.neighbours[self.offsets[vid]:self.offsets[vid + 1]]:
+            self.edgeChanged(vid, w)
+        self.removed.add(vid)
+        if self.spatialIndex != None:
+            self.spatialIndex.remove(CompactVertex(self, vid))
+        self.structureChanged = True
+        if compact:
+            self.compact()
+
+    def compact(self):
+        """Rebuild the arrays without the removed vertices (and their edges), in one pass.
+        Returns the new vid of every vertex whose vid changed (by old vid), like GraphBase.compact."""
+        if not self.removed:
+            return {}
+        self.spatialIndex = None # The views in it have outdated vids, it's built again when needed
+        newVids, remap, kept = [], {}, 0
+        for vid in range(len(self.xs)):
+            if vid in self.removed:
+                newVids.append(None)
+                continue
+            if vid != kept:
+                remap[vid] = kept
+            newVids.append(kept)
+            kept += 1
+        edges = [(newVids[a], newVids[b], cost) for a, b, cost in self.edgeTriples()
+                 if newVids[a] != None and newVids[b] != None]
+        self.xs = array('d', (x for vid, x in enumerate(self.xs) if newVids[vid] != None))
+        self.ys = array('d', (y for vid, y in enumerate(self.ys) if newVids[vid] != None))
+        self.removed = set()
+        self.setEdges(edges)
+        return remap
+
+    def addEdge(self, vidA, vidB, cost=None):
+        assert vidA != vidB
+        if self.edgeIndex(vidA, vidB) != None:
+            return False
+        cost = self.edgeCost(vidA, vidB, cost)
+        for a, b in [(vidA, vidB), (vidB, vidA)]:
+            i = bisect_left(self.neighbours, b, self.offsets[a], self.offsets[a + 1])
+            self.neighbours.insert(i, b)
+            self.costs.insert(i, cost)
+            for v in range(a + 1, len(self.offsets)):
+                self.offsets[v] += 1
+        self.edgeChanged(vidA, vidB)
+        return True
+
+    def removeEdge(self, vidA, vidB):
+        for a, b in [(vidA, vidB), (vidB, vidA)]:
+            i = self.edgeIndex(a, b)
+            del self.neighbours[i]
+            del self.costs[i]
+            for v in range(a + 1, len(self.offsets)):
+                self.offsets[v] -= 1
+        self.edgeChanged(vidA, vidB)
+
+    def addEdges(self, edges):
+        """Add many edges at once, given as (vidA, vidB, cost) triples (with cost None for the Euclidean cost),
+        by rebuilding the arrays once. Like addEdge, edges that are already there are ignored."""
+        pairs = {}
+        for a, b, cost in self.edgeTriples():
+            pairs[a * len(self.xs) + b] = cost
+        for a, b, cost in edges:
+            assert a != b
+            if a > b:
+                a, b = b, a
+            key = a * len(self.xs) + b
+            if key not in pairs:
+                pairs[key] = self.edgeCost(a, b, cost)
+                self.edgeChanged(a, b)
+        n = len(self.xs)
+        self.setEdges((key // n, key % n, cost) for key, cost in sorted(pairs.items()))
+
+    def setEdges(self, edges):
+        # Rebuild the CSR arrays from (vidA, vidB, cost) triples with vidA < vidB, sorted and without duplicates
+        edges = list(edges)
+        degrees = [0] * len(self.xs)
+        for a, b, _ in edges:
+            degrees[a] += 1
+            degrees[b] += 1
+        self.offsets = array('q', [0])
+        for d in degrees:
+            self.offsets.append(self.offsets[-1] + d)
+        self.neighbours = array('i', bytes(4 * self.offsets[-1]))
+        self.costs = array('i', bytes(4 * self.offsets[-1]))
+        # Filling the rows in the sorted order of the edges keeps every row sorted
+        fill = self.offsets[:-1]
+        for a, b, cost in edges:
+            for u, w in [(a, b), (b, a)]:
+                self.neighbours[fill[u]] = w
+                self.costs[fill[u]] = cost
+                fill[u] += 1
+
+    def edgeTriples(self):
+        """All edges as (vidA, vidB, cost) triples with vidA < vidB, sorted"""
+        offsets, neighbours, costs = self.offsets, self.neighbours, self.costs
+        for a in range(len(self.xs)):
+            for i in range(offsets[a], offsets[a + 1]):
+                if a < neighbours[i]:
+                    yield a, neighbours[i], costs[i]
+
+    def move(self, vid, pos):
+        # Move a vertex, in a Euclidean graph the costs of its edges change with it
+        self.xs[vid], self.ys[vid] = pos.x, pos.y
+        if not self.isEuclidean:
+            return
+        for i in range(self.offsets[vid], self.offsets[vid + 1]):
+            w = self.neighbours[i]
+            cost = self.edgeCost(vid, w)
+            if cost != self.costs[i]:
+                self.costs[i] = self.costs[self.edgeIndex(w, vid)] = cost
+                self.edgeChanged(vid, w)
+
+    @staticmethod
+    def fromArrays(xs, ys, edges=(), euclidean=False):
+        """A compact graph with the given coordinate arrays (which are used, not copied) and (vidA, vidB, cost) edges"""
+        compact = CompactGraph(euclidean)
+        compact.xs, compact.ys = xs, ys
+        compact.offsets = array('q', bytes(8 * (len(xs) + 1)))
+        compact.addEdges(edges)
+        return compact
+
+    @staticmethod
+    def fromGraph(graph):
+        """A compact copy of a graph"""
+        compact = CompactGraph(graph.isEuclidean)
+        compact.name = graph.name
+        for v in graph.vertices:
+            compact.addVertex(v)
+        compact.addEdges((e.a.vid, e.b.vid, e.cost) for v in graph.vertices for e in v.edges if e.a == v)
+        compact.clearChanges()
+        return compact
+
+
+class CompleteGraph(CompactGraph):
+    """A complete graph for TSPLIB instances, whose edge costs are implied by the coordinates (with one of the TSPLIB
+    distance functions, see TSPLIB_DISTANCES) or given by an explicit distance matrix. The costs are computed when
+    they're needed, so only the coordinates (or the matrix) are stored and no edges are materialized.
+    The matrix is packed: the cost of vidA > vidB is weights[vidA * (vidA - 1) // 2 + vidB]."""
+    def __init__(self, weightType='EUC_2D', weights=None):
+        if weightType not in TSPLIB_DISTANCES:
+            raise ValueError("Unsupported edge weight type: '{}'".format(weightType))
+        CompactGraph.__init__(self, False)
+        self.weightType = weightType
+        self.weights = weights
+
+    def cost(self, vidA, vidB):
+        if vidA == vidB:
+            return sys.maxsize
+        return TSPLIB_DISTANCES[self.weightType](self, vidA, vidB)
+
+    def edgeCost(self, vidA, vidB, cost=None):
+        return self.cost(vidA, vidB)
+
+    def edgesOf(self, v):
+        return [Edge(v, CompactVertex(self, vid), self.cost(v.vid, vid)) for vid in range(len(self.xs)) if vid != v.vid]
+
+    def edgeTo(self, v, vid):
+        if vid == v.vid or not 0 <= vid < len(self.xs):
+            return None
+        return Edge(v, CompactVertex(self, vid), self.cost(v.vid, vid))
+
+    def addEdge(self, vidA, vidB, cost=None):
+        return False # All edges are there already
+
+    def addEdges(self, edges):
+        pass
+
+    def removeEdge(self, vidA, vidB):
+        raise NotImplementedError("The edges of a complete graph can't be removed")
+
+    def move(self, vid, pos):
+        self.xs[vid], self.ys[vid] = pos.x, pos.y
+        if self.weightType != 'EXPLICIT':
+            for w in range(len(self.xs)):
+                if w != vid:
+                    self.edgeChanged(vid, w)
+
+    def compact(self):
+        kept = [vid for vid in range(len(self.xs)) if vid not in self.removed]
+        if self.weights != None and self.removed:
+            self.weights = array('i', (self.cost(a, b) for i, a in enumerate(kept) for b in kept[:i]))
+        return CompactGraph.compact(self)
+
+    @staticmethod
+    def fromArrays(xs, ys, weightType='EUC_2D', weights=None):
+        """A complete graph with the given coordinate arrays and (packed) distance matrix, which are used, not copied"""
+        graph = CompleteGraph(weightType, weights)
+        graph.xs, graph.ys = xs, ys
+        graph.offsets = array('q', bytes(8 * (len(xs) + 1)))
+        return graph
+
+
+def _nint(x):
+    return int(x + 0.5)
+
+def _geoRadians(x):
+    # A TSPLIB GEO coordinate (DDD.MM, degrees and minutes) in radians
+    degrees = int(x)
+    return 3.141592 * (degrees + 5.0 * (x - degrees) / 3.0) / 180.0
+
+def _geoDistance(graph, a, b):
+    latA, lonA, latB, lonB = [_geoRadians(c) for c in (graph.xs[a], graph.ys[a], graph.xs[b], graph.ys[b])]
+    q1, q2, q3 = math.cos(lonA - lonB), math.cos(latA - latB), math.cos(latA + latB)
+    return int(6378.388 * math.acos(0.5 * ((1.0 + q1) * q2 - (1.0 - q1) * q3)) + 1.0)
+
+def _attDistance(graph, a, b):
+    x, y = graph.xs[a] - graph.xs[b], graph.ys[a] - graph.ys[b]
+    r = ((x*x + y*y) / 10.0) ** 0.5
+    return _nint(r) + 1 if _nint(r) < r else _nint(r)
+
+def _explicitDistance(graph, a, b):
+    if a < b:
+        a, b = b, a
+    return graph.weights[a * (a - 1) // 2 + b]
+
+# The TSPLIB distance functions (as defined in the TSPLIB documentation) by EDGE_WEIGHT_TYPE
+TSPLIB_DISTANCES = {
+    'EUC_2D': lambda g, a, b: _nint(math.hypot(g.xs[a] - g.xs[b], g.ys[a] - g.ys[b])),
+    'CEIL_2D': lambda g, a, b: math.ceil(math.hypot(g.xs[a] - g.xs[b], g.ys[a] - g.ys[b])),
+    'MAN_2D': lambda g, a, b: _nint(abs(g.xs[a] - g.xs[b]) + abs(g.ys[a] - g.ys[b])),
+    'MAX_2D': lambda g, a, b: max(_nint(abs(g.xs[a] - g.xs[b])), _nint(abs(g.ys[a] - g.ys[b]))),
+    'GEO': _geoDistance,
+    'ATT': _attDistance,
+    'EXPLICIT': _explicitDistance,
+}
+
+
+class CompactVertices():
+    """The vertex list of a CompactGraph, which creates the vertex views when they're accessed"""
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __len__(self):
+        return len(self.graph.xs)
+
+    def __getitem__(self, vid):
+        if vid < 0:
+            vid += len(self)
+        if not 0 <= vid < len(self):
+            raise IndexError("vertex id out of range")
+        return CompactVertex(self.graph, vid)
+
+    def __iter__(self):
+        return (CompactVertex(self.graph, vid) for vid in range(len(self)))
+
+
 #
 # Vertices
 #
@@ -109,40 +483,77 @@ class VertexBase():
     @pos.setter
     def pos(self, value):
         self._pos = value
+        self.graph.vertexMoved(self)
 
 
 class Vertex(VertexBase):
-    """A vertex that stores its edges itself"""
+    """A vertex that stores its edges itself, indexed by the neighbour they lead to"""
     def __init__(self, graph, vertexId, pos, edges=None):
         VertexBase.__init__(self, graph, vertexId, pos)
-        self.edges = [] if edges == None else edges
+        # The edge to every neighbour (by vertex rather than vid, as vids change when vertices are removed), in insertion order
+        self.adjacent = {}
+        for e in edges or []:
+            self.addEdge(e)
+
+    @property
+    def edges(self):
+        return self.adjacent.values()
 
     @VertexBase.pos.setter
     def pos(self, value):
         self._pos = value
+        self.graph.vertexMoved(self)
         if self.graph.isEuclidean:
             for e in self.edges:
+                cost = e.cost
                 e.euclideanCost()
+                if e.cost != cost:
+                    self.graph.edgeChanged(e.a.vid, e.b.vid)
 
     def addEdge(self, edge):
         """Add an edge if it's not already in the edge list"""
-        if self != edge.a and self != edge.b:
+        other = edge.other(self)
+        if other == None or other in self.adjacent:
             return False
-        for e in self.edges:
-            if e.isDuplicate(edge):
-                return False
-        self.edges.append(edge)
-        assert edge.other(self) != None
-        assert edge.other(edge.other(self)) != None
+        self.adjacent[other] = edge
         return True
 
     def getEdgeTo(self, vid):
         # Returns the edge from this vertex to a vertex with vertex-id 'vid'
-        for e in self.edges:
-            if e.other(self):
-                if e.other(self).vid == vid:
-                    return e
-        return None
+        if not 0 <= vid < len(self.graph.vertices):
+            return None
+        return self.adjacent.get(self.graph.vertices[vid])
+
+
+class CompactVertex(VertexBase):
+    """A view on a vertex of a CompactGraph, two views of the same vertex are equal"""
+    def __init__(self, graph, vertexId):
+        self.graph = graph
+        self.vid = vertexId
+        self.name = ""
+
+    def __eq__(self, other):
+        return type(other) is CompactVertex and self.vid == other.vid and self.graph is other.graph
+
+    def __hash__(self):
+        return hash(self.vid)
+
+    @property
+    def pos(self):
+        return Pos(self.graph.xs[self.vid], self.graph.ys[self.vid])
+    @pos.setter
+    def pos(self, value):
+        self.graph.move(self.vid, value)
+        self.graph.vertexMoved(self)
+
+    @property
+    def edges(self):
+        """The edges to the neighbours (new Edge objects, so changing them doesn't change the graph)"""
+        return self.graph.edgesOf(self)
+
+    def getEdgeTo(self, vid):
+        # Returns the edge from this vertex to a vertex with vertex-id 'vid'
+        return self.graph.edgeTo(self, vid)
 
 
 class Bag(Vertex):
@@ -157,6 +568,7 @@ class Bag(Vertex):
         result = False
         if v not in self.vertices:
             self.vertices.append(v)
+            self.graph.changedVertices.add(self.vid)
             result = True
         return result
 
@@ -164,6 +576,7 @@ class Bag(Vertex):
         """Remove a vertex from the bag"""
         if v in self.vertices:
             self.vertices.remove(v)
+            self.graph.changedVertices.add(self.vid)
             return True
         return False
 
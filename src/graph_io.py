@@ -0,0 +1,366 @@
+"""
+This module contains the reading (and writing) of graph files
+"""
+import gc
+import sys
+import math
+import mmap
+import struct
+import argparse
+from array import array
+from contextlib import contextmanager, nullcontext
+from .settings import Pos
+from .graph import *
+
+
+# The keywords of the specification part of TSPLIB files ('KEYWORD : value' lines)
+HEADERS = {'NAME', 'TYPE', 'COMMENT', 'DIMENSION', 'CAPACITY', 'EDGE_WEIGHT_TYPE', 'EDGE_WEIGHT_FORMAT', 'EDGE_DATA_FORMAT',
+           'NODE_COORD_TYPE', 'DISPLAY_DATA_TYPE'}
+# The sections of TSPLIB files, and those of our own format: EDGE_SECTION ('vid vid [cost]' lines),
+#   BAG_COORD_SECTION ('vid x y vid...' lines, a bag and its vertices) and BAG_EDGE_SECTION ('vid vid' lines)
+SECTIONS = {'NODE_COORD_SECTION', 'DEPOT_SECTION', 'DEMAND_SECTION', 'EDGE_DATA_SECTION', 'FIXED_EDGES_SECTION',
+            'DISPLAY_DATA_SECTION', 'TOUR_SECTION', 'EDGE_WEIGHT_SECTION', 'EDGE_SECTION', 'BAG_COORD_SECTION',
+            'BAG_EDGE_SECTION', 'EOF'}
+# The sections with lists that are terminated by -1
+LISTS = {'DEPOT_SECTION', 'EDGE_DATA_SECTION', 'FIXED_EDGES_SECTION', 'TOUR_SECTION'}
+
+# The binary format starts with this magic number, see writeBinary
+BINARY_MAGIC = b'GTB1'
+# The header of the binary format: the magic number, the version, whether the graph is Euclidean and the lengths of
+#   the name, the weight type and all arrays (the number of vertices, neighbour entries, weights, bags, bag members and bag edges)
+BINARY_HEADER = struct.Struct('<4sII8q')
+BINARY_VERSION = 1
+
+
+def readGraph(path, vidStart=1, compact=False):
+    """Read a graph and its tree decomposition from a text or binary file, returns the tree decomposition.
+    Binary files are always read into a CompactGraph, which is memory mapped if compact is set (see readBinary)."""
+    with open(path, 'rb') as f:
+        binary = f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+    # Loading creates many objects that all stay alive, so the garbage collector would only waste time on them
+    with _pausedGc():
+        if binary:
+            return readBinary(path, compact)
+        with open(path) as f:
+            return parseGraph(f, vidStart, compact)
+
+@contextmanager
+def _pausedGc():
+    # Disable the (cyclic) garbage collector for a while, unless it's disabled already
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def parseGraph(lines, vidStart=1, compact=False):
+    """Parse a graph and its tree decomposition from an iterable of lines, returns the tree decomposition.
+    Besides our own format, this reads TSPLIB files: the (integer or float) coordinates of the NODE_COORD_SECTION
+    (or DISPLAY_DATA_SECTION), the edges of an EDGE_DATA_SECTION, explicit distance matrices in all EDGE_WEIGHT_FORMATs
+    and the DEMAND_SECTION and DEPOT_SECTION (stored in demands and depots of the original graph).
+    The lines are read one by one and the coordinates go straight into arrays, preallocated if the DIMENSION is given.
+    If the file has edges, the original graph is a Graph (or a CompactGraph if compact is set), the costs left out
+    of the EDGE_SECTION are our Euclidean ones for EUC_2D graphs, those of the EDGE_DATA_SECTION follow the EDGE_WEIGHT_TYPE.
+    Without edges, a file with an EDGE_WEIGHT_TYPE is a complete graph, a CompleteGraph that computes the costs when needed."""
+    header, section = {}, None
+    xs, ys, hasCoords = array('d'), array('d'), False
+    edges, dataEdges, weights, pairs = [], [], None, None
+    demands, depots, bags, bagEdges = {}, [], [], []
+
+    for line in lines:
+        tokens = line.split()
+        if not tokens:
+            continue
+        keyword = tokens[0].rstrip(':')
+        if keyword in HEADERS:
+            header[keyword] = line.partition(':')[2].strip()
+            if keyword == 'DIMENSION':
+                xs, ys = array('d', bytes(8 * int(header[keyword]))), array('d', bytes(8 * int(header[keyword])))
+            continue
+        if keyword in SECTIONS:
+            section = keyword
+            if section == 'EDGE_WEIGHT_SECTION':
+                n = len(xs)
+                weights = array('i', bytes(4 * (n * (n - 1) // 2)))
+                pairs = _matrixPairs(header.get('EDGE_WEIGHT_FORMAT', 'FULL_MATRIX'), n)
+            elif section == 'EOF':
+                break
+            elif section in {'EDGE_SECTION', 'EDGE_DATA_SECTION'}:
+                header.setdefault(section, True)
+            continue
+        if section in LISTS and tokens[0] == '-1':
+            continue
+        # Add vertices, edges, weights, bags or bag edges
+        if section == 'NODE_COORD_SECTION' or (section == 'DISPLAY_DATA_SECTION' and 'NODE_COORD_SECTION' not in header):
+            vid = int(tokens[0]) - vidStart
+            if vid >= len(xs):
+                xs.extend([0] * (vid + 1 - len(xs)))
+                ys.extend([0] * (vid + 1 - len(ys)))
+            xs[vid], ys[vid] = _number(tokens[1]), _number(tokens[2])
+            header.setdefault(section, True)
+            hasCoords = True
+        elif section == 'EDGE_SECTION':
+            # Euclidean graphs may leave the cost out, it's computed from the coordinates then
+            cost = int(tokens[2]) if len(tokens) > 2 else None
+            edges.append((int(tokens[0]) - vidStart, int(tokens[1]) - vidStart, cost))
+        elif section == 'EDGE_DATA_SECTION':
+            if header.get('EDGE_DATA_FORMAT', 'EDGE_LIST') == 'ADJ_LIST':
+                vids = [int(t) - vidStart for t in tokens if t != '-1']
+                dataEdges.extend((vids[0], vid) for vid in vids[1:])
+            else:
+                dataEdges.append((int(tokens[0]) - vidStart, int(tokens[1]) - vidStart))
+        elif section == 'EDGE_WEIGHT_SECTION':
+            for token in tokens:
+                a, b = sorted(next(pairs), reverse=True)
+                if a != b:
+                    weights[a * (a - 1) // 2 + b] = int(_number(token))
+        elif section == 'DEMAND_SECTION':
+            demands[int(tokens[0]) - vidStart] = int(tokens[1])
+        elif section == 'DEPOT_SECTION':
+            depots.append(int(tokens[0]) - vidStart)
+        elif section == 'BAG_COORD_SECTION':
+            bags.append((int(tokens[0]) - vidStart, Pos(_number(tokens[1]), _number(tokens[2])),
+                         [int(t) - vidStart for t in tokens[3:]]))
+        elif section == 'BAG_EDGE_SECTION':
+            bagEdges.append((int(tokens[0]) - vidStart, int(tokens[1]) - vidStart))
+
+    # Vertices without coordinates (only a distance matrix) are laid out in a grid
+    if not hasCoords:
+        width = max(1, math.ceil(len(xs) ** 0.5))
+        for vid in range(len(xs)):
+            xs[vid], ys[vid] = 40 + 60 * (vid % width), 40 + 60 * (vid // width)
+    weightType = header.get('EDGE_WEIGHT_TYPE')
+    if 'EDGE_SECTION' in header or 'EDGE_DATA_SECTION' in header or weightType == None:
+        if dataEdges:
+            metric = CompleteGraph.fromArrays(xs, ys, weightType, weights) if weightType else None
+            edges += [(a, b, metric.cost(a, b) if metric else 1) for a, b in dataEdges]
+        origGraph = _graphWithEdges(xs, ys, edges, weightType == 'EUC_2D', compact)
+    else:
+        origGraph = CompleteGraph.fromArrays(xs, ys, weightType, weights)
+    origGraph.clearChanges()
+    origGraph.name = header.get('NAME', "")
+    origGraph.demands, origGraph.depots = demands, depots
+
+    graph = TreeDecomposition(origGraph)
+    graph.name = origGraph.name
+    for vid, pos, vids in bags:
+        bag = Bag(graph, vid, pos)
+        for v in vids:
+            bag.addVertex(origGraph.vertices[v])
+        graph.addVertex(bag)
+    for a, b in bagEdges:
+        graph.addEdge(a, b, 1)
+    graph.clearChanges()
+    return graph
+
+def _graphWithEdges(xs, ys, edges, euclidean, compact):
+    # A Graph (or CompactGraph) with the given coordinates and (vidA, vidB, cost) edges
+    if compact:
+        return CompactGraph.fromArrays(xs, ys, edges, euclidean)
+    graph = Graph(euclidean)
+    for vid in range(len(xs)):
+        graph.addVertex(Vertex(graph, vid, Pos(xs[vid], ys[vid])))
+    for a, b, cost in edges:
+        graph.addEdge(a, b, cost)
+    return graph
+
+def _matrixPairs(weightFormat, n):
+    # The (row, column) pairs of the entries of an explicit distance matrix in the order of the TSPLIB format.
+    #   The matrix is symmetric, so a column wise format has the same pairs as the row wise one of the other triangle.
+    rows = {
+        'FULL_MATRIX': lambda i: range(n),
+        'UPPER_ROW': lambda i: range(i + 1, n), 'LOWER_COL': lambda i: range(i + 1, n),
+        'LOWER_ROW': lambda i: range(i), 'UPPER_COL': lambda i: range(i),
+        'UPPER_DIAG_ROW': lambda i: range(i, n), 'LOWER_DIAG_COL': lambda i: range(i, n),
+        'LOWER_DIAG_ROW': lambda i: range(i + 1), 'UPPER_DIAG_COL': lambda i: range(i + 1),
+    }
+    if weightFormat not in rows:
+        raise ValueError("Unsupported edge weight format: '{}'".format(weightFormat))
+    for i in range(n):
+        for j in rows[weightFormat](i):
+            yield i, j
+
+def _number(s):
+    # An int if possible, a float otherwise
+    try:
+        return int(s)
+    except ValueError:
+        return float(s)
+
+
+#
+# Writing graphs
+#
+def graphLines(td, vidStart=1):
+    """The lines of the text format of a graph and its tree decomposition. Complete graphs are written as TSPLIB files
+    (with their coordinates, and their distance matrix as LOWER_ROW if it's explicit), other graphs with an EDGE_SECTION."""
+    graph = td.originalGraph
+    weightType = graph.weightType if isinstance(graph, CompleteGraph) else 'EUC_2D' if graph.isEuclidean else None
+    yield "NAME : {}".format(td.name)
+    yield "DIMENSION : {}".format(len(graph.vertices))
+    if weightType:
+        yield "EDGE_WEIGHT_TYPE : {}".format(weightType)
+    if weightType == 'EXPLICIT':
+        yield "EDGE_WEIGHT_FORMAT : LOWER_ROW"
+    yield "NODE_COORD_SECTION"
+    for v in graph.vertices:
+        yield "{} {} {}".format(v.vid + vidStart, _formatNumber(v.pos.x), _formatNumber(v.pos.y))
+    if weightType == 'EXPLICIT':
+        yield "EDGE_WEIGHT_SECTION"
+        for a in range(1, len(graph.vertices)):
+            yield " ".join(str(graph.cost(a, b)) for b in range(a))
+    elif isinstance(graph, CompactGraph):
+        yield "EDGE_SECTION"
+        for a, b, cost in graph.edgeTriples():
+            yield "{} {} {}".format(a + vidStart, b + vidStart, cost)
+    else:
+        yield "EDGE_SECTION"
+        for v in graph.vertices:
+            for e in v.edges:
+                if v.vid < e.other(v).vid:
+                    yield "{} {} {}".format(v.vid + vidStart, e.other(v).vid + vidStart, int(e.cost))
+    if td.vertices:
+        yield "BAG_COORD_SECTION"
+        for b in td.vertices:
+            yield " ".join([str(b.vid + vidStart), _formatNumber(b.pos.x), _formatNumber(b.pos.y)]
+                           + [str(v.vid + vidStart) for v in b.vertices])
+        yield "BAG_EDGE_SECTION"
+        for b in td.vertices:
+            for e in b.edges:
+                if b.vid < e.other(b).vid:
+                    yield "{} {}".format(b.vid + vidStart, e.other(b).vid + vidStart)
+
+def writeGraph(td, f, vidStart=1, chunkLines=4096):
+    """Write a graph and its tree decomposition in the text format to a file-like object (anything with a write method).
+    The lines are written in chunks as they're generated, so the whole file is never in memory."""
+    chunk = []
+    for line in graphLines(td, vidStart):
+        chunk.append(line)
+        if len(chunk) >= chunkLines:
+            f.write("\n".join(chunk) + "\n")
+            chunk = []
+    if chunk:
+        f.write("\n".join(chunk) + "\n")
+
+def saveGraph(td, path, vidStart=1):
+    """Save a graph and its tree decomposition to a file, in the binary format if the path ends with .gtb"""
+    if path.endswith('.gtb'):
+        writeBinary(td, path)
+        return
+    with open(path, 'w') as f:
+        writeGraph(td, f, vidStart)
+
+def _formatNumber(x):
+    # Whole numbers without a fraction, like in the files we read
+    return str(int(x)) if float(x).is_integer() else repr(float(x))
+
+
+#
+# The binary format
+#
+def writeBinary(td, target):
+    """Write a graph and its tree decomposition to a binary file (a path or a binary file-like object). After the header (see BINARY_HEADER) and the name and
+    weight type (utf-8), it contains the arrays of a CompactGraph (the coordinates, the CSR offsets, neighbours and costs
+    and the packed distance matrix of an explicit CompleteGraph) and of the bags (their coordinates, the offsets of their
+    vertices in the member array, the members and the vid pairs of the bag edges), little endian and aligned to 8 bytes."""
+    graph = td.originalGraph if isinstance(td.originalGraph, CompactGraph) else CompactGraph.fromGraph(td.originalGraph)
+    assert not graph.removed, "Compact the graph before writing it"
+    weightType = graph.weightType if isinstance(graph, CompleteGraph) else ''
+    weights = graph.weights if weightType == 'EXPLICIT' and graph.weights != None else array('i')
+    bagXs, bagYs, bagOffsets, members, bagEdges = array('d'), array('d'), array('q', [0]), array('i'), array('i')
+    for b in td.vertices:
+        bagXs.append(b.pos.x)
+        bagYs.append(b.pos.y)
+        members.extend(v.vid for v in b.vertices)
+        bagOffsets.append(len(members))
+        bagEdges.extend(vid for e in b.edges if b.vid < e.other(b).vid for vid in (b.vid, e.other(b).vid))
+    name, weightType = td.name.encode(), weightType.encode()
+
+    with (open(target, 'wb') if isinstance(target, str) else nullcontext(target)) as f:
+        f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, graph.isEuclidean, len(name), len(weightType),
+                                   len(graph.xs), len(graph.neighbours), len(weights), len(td.vertices), len(members), len(bagEdges)))
+        for data in [name, weightType]:
+            f.write(data + bytes(-len(data) % 8))
+        for typecode, values in [('d', graph.xs), ('d', graph.ys), ('q', graph.offsets), ('i', graph.neighbours), ('i', graph.costs),
+                                 ('i', weights), ('d', bagXs), ('d', bagYs), ('q', bagOffsets), ('i', members), ('i', bagEdges)]:
+            if sys.byteorder == 'big' or not isinstance(values, (array, memoryview)):
+                values = array(typecode, values)
+                if sys.byteorder == 'big':
+                    values.byteswap()
+            data = memoryview(values).cast('B')
+            f.write(data)
+            f.write(bytes(-len(data) % 8))
+
+def readBinary(path, mapped=True):
+    """Read a graph and its tree decomposition from a binary file (see writeBinary), returns the tree decomposition.
+    The original graph is a CompactGraph (or a CompleteGraph). If mapped is set, its arrays are read only views on the
+    memory mapped file, so loading doesn't copy them (and the OS only reads the parts that are used). Otherwise they're
+    copied into arrays, which can be edited."""
+    with open(path, 'rb') as f:
+        if mapped and sys.byteorder == 'little':
+            data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        else:
+            mapped, data = False, memoryview(f.read())
+    if len(data) < BINARY_HEADER.size or bytes(data[:len(BINARY_MAGIC)]) != BINARY_MAGIC:
+        raise ValueError("'{}' is not a binary graph file".format(path))
+    _, version, euclidean, nameLength, weightTypeLength, n, entries, weightCount, bagCount, memberCount, bagEdgeCount = \
+        BINARY_HEADER.unpack_from(data)
+    if version != BINARY_VERSION:
+        raise ValueError("Unsupported binary graph file version: {}".format(version))
+    position = BINARY_HEADER.size
+    def take(typecode, count):
+        # The next array (or bytes, for typecode 'B') in the file, as a view or a copy
+        nonlocal position
+        size = count * array(typecode).itemsize
+        view = data[position:position + size].cast(typecode)
+        position += size + (-size % 8)
+        if mapped or typecode == 'B':
+            return view
+        values = array(typecode, view)
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values
+    name, weightType = bytes(take('B', nameLength)).decode(), bytes(take('B', weightTypeLength)).decode()
+    xs, ys, offsets, neighbours, costs = take('d', n), take('d', n), take('q', n + 1), take('i', entries), take('i', entries)
+    weights = take('i', weightCount)
+
+    if weightType:
+        graph = CompleteGraph.fromArrays(xs, ys, weightType, weights if weightType == 'EXPLICIT' else None)
+    else:
+        # The CSR arrays are used as they are, they're complete and sorted already
+        graph = CompactGraph(bool(euclidean))
+        graph.xs, graph.ys, graph.offsets, graph.neighbours, graph.costs = xs, ys, offsets, neighbours, costs
+    graph.name = name
+    td = TreeDecomposition(graph)
+    td.name = name
+    bagXs, bagYs, bagOffsets = take('d', bagCount), take('d', bagCount), take('q', bagCount + 1)
+    # The bags are objects anyway, so their arrays are converted to lists at once
+    bagOffsets, members, bagEdges = bagOffsets.tolist(), take('i', memberCount).tolist(), take('i', bagEdgeCount).tolist()
+    for vid in range(bagCount):
+        bag = Bag(td, vid, Pos(bagXs[vid], bagYs[vid]))
+        bag.vertices = [CompactVertex(graph, v) for v in members[bagOffsets[vid]:bagOffsets[vid + 1]]]
+        td.addVertex(bag)
+    for i in range(0, bagEdgeCount, 2):
+        td.addEdge(bagEdges[i], bagEdges[i + 1], 1)
+    td.clearChanges()
+    return td
+
+def convertGraph(source, target, vidStart=1):
+    """Convert a graph file from text to binary or the other way around (binary if the target ends with .gtb)"""
+    saveGraph(readGraph(source, vidStart), target, vidStart)
+
+
+def main(argv=None):
+    """The entrypoint for converting graph files"""
+    parser = argparse.ArgumentParser(description="Convert graph files between the text and the binary (.gtb) format.")
+    parser.add_argument('source', help="the graph file to read (text or binary)")
+    parser.add_argument('target', help="the graph file to write, binary if it ends with .gtb and text otherwise")
+    args = parser.parse_args(argv)
+    convertGraph(args.source, args.target)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+This module contains the instrumentation of the DP: counters and timings per bag
+"""
+import os
+import json
+import time
+
+COUNTERS = ['states', 'memoHits', 'edgeSelects', 'localHits', 'rejections', 'tableSize', 'time']
+
+
+class SolveStats():
+    """The counters per bag of a DP solve: the states computed, the requests and lookups answered from a table
+    (memoHits), the local edge selections (edgeSelects) and how many of those were memoized (localHits),
+    the edge selections without any valid set of paths (rejections), the table size and the wall time
+    (the recursive engine includes the time spent on the children).
+    Also keeps a timeline of the work on every bag, which can be exported as a Chrome trace."""
+    def __init__(self):
+        self.bags = {} # The counters per bag (by vid)
+        self.events = [] # (bag vid, phase, start, duration, process id) per piece of work on a bag
+        self.start = time.perf_counter()
+
+    def bag(self, vid):
+        """The counters of a bag"""
+        if vid not in self.bags:
+            self.bags[vid] = dict.fromkeys(COUNTERS, 0)
+        return self.bags[vid]
+
+    def count(self, vid, counter, n=1):
+        """Add n to a counter of a bag"""
+        self.bag(vid)[counter] += n
+
+    def timed(self, vid, phase, start):
+        """Register the work on a bag in the given phase that started at start (a time.perf_counter value)"""
+        end = time.perf_counter()
+        self.bag(vid)['time'] += end - start
+        self.events.append((vid, phase, start, end - start, os.getpid()))
+
+    def merge(self, other):
+        """Add the counters and events of another (for example a worker process) to these"""
+        for vid, counters in other.bags.items():
+            bag = self.bag(vid)
+            for counter, n in counters.items():
+                bag[counter] = max(bag[counter], n) if counter == 'tableSize' else bag[counter] + n
+        self.events += other.events
+
+    def totals(self):
+        """The counters summed over all bags (and the largest table size)"""
+        totals = dict.fromkeys(COUNTERS, 0)
+        for counters in self.bags.values():
+            for counter, n in counters.items():
+                totals[counter] = max(totals[counter], n) if counter == 'tableSize' else totals[counter] + n
+        return totals
+
+    def slowest(self, count=5):
+        """The vids and counters of the bags that took the most time"""
+        return sorted(self.bags.items(), key=lambda item: item[1]['time'], reverse=True)[:count]
+
+    def toJson(self):
+        """A (json serializable) dictionary with the totals and the counters per bag"""
+        return {'totals': self.totals(), 'bags': {str(vid): counters for vid, counters in sorted(self.bags.items())}}
+
+    def writeJson(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.toJson(), f, indent=2)
+
+    def writeChromeTrace(self, path):
+        """Write the timeline in the Chrome trace event format (open it in chrome://tracing or Perfetto).
+        Every process gets its own row, with a complete event per piece of work on a bag."""
+        events = []
+        for vid, phase, start, duration, pid in self.events:
+            events.append({'name': 'X{} {}'.format(vid, phase), 'cat': phase, 'ph': 'X', 'pid': pid, 'tid': pid,
+                           'ts': (start - self.start) * 1e6, 'dur': duration * 1e6, 'args': self.bags.get(vid, {})})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
@@ -49,19 +49,11 @@ class Application(Frame):
     def quitApp(self):
         self.mainWindow.quit()
 
-    def broSave(self, content, name=False):
-        """Save content to file"""
-        f = filedialog.asksaveasfile(mode='w', defaultextension=".txt")
-        if f is None: # asksaveasfile returns `None` if the dialog is closed with 'cancel'.
-            self.resetModifyKeys()
-            return
-        if name:
-            filename = os.path.splitext(os.path.basename(f.name))[0]
-            content = "NAME : {}\n{}".format(filename, content)
-            self.setTitle(filename)
-        f.write(content)
-        f.close()
+    def broSave(self):
+        """Ask for a file to save to, returns its path (or an empty string if the dialog is cancelled)"""
+        f = filedialog.asksaveasfilename(defaultextension=".txt")
         self.resetModifyKeys()
+        return f or ""
 
     def broOpen(self):
         """Open a file"""
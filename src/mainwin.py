@@ -1,12 +1,18 @@
 from .win import *
 from .colors import *
+from .drawing import GraphDrawing
 from .graph_interaction import *
 import src.unittests
 
 
-class MainWin(Win):
+class MainWin(Win, GraphDrawing):
+    # The tags of the canvas items from bottom to top, for the graph (or decomposition) and the original graph
+    layers = ['background', 'help'] + ['{} {}'.format(graph, item) for graph in ['graph', 'original']
+                                        for item in ['edge', 'cost', 'hover', 'vertex', 'label']]
+
     def __init__(self, settings, app):
         Win.__init__(self, settings, app, Pos(0, 0))
+        self.scene = Scene(self.g, MainWin.layers)
 
         self.selectedScrollbar = -1 # Mark the scrollbar that is selected while a mousekey is down (1=vert, 2=hor)
         self.scrollImgs = None
@@ -14,83 +20,62 @@ class MainWin(Win):
         self.mouseDownButton = -1
         self.mouseDownStartPos = Pos(-1, -1)
         self.redrawMarker = False
+        self.updateMarker = False
+        self.drawnOffset = Pos(0, 0) # The offset of the dragged (selected) vertices on the canvas
+        self.clustered = False # Whether the last frame showed clusters instead of the separate vertices
         self.scaleFactor = 1
 
         self.graphInteraction = GraphInteraction(self)
 
         src.unittests.UnitTests(self)
 
-    @property
-    def isTreeDecomposition(self):
-        return self.graphInteraction.isTreeDecomposition
-
-    def redraw(self):
-        """Mark the window for redrawing"""
-        self.redrawMarker = True
+    def redraw(self, full=True):
+        """Mark the window for redrawing, or (if not full) only for updating the hovered and dragged vertices"""
+        if full:
+            self.redrawMarker = True
+        else:
+            self.updateMarker = True
 
     def draw(self):
-        """Draw the main window"""
+        """Draw the main window, the canvas items are kept between frames and only the ones that changed are updated"""
         # Draw myself
-        self.fullClear()
+        self.scene.begin()
+        self.drawRect(self.colors.bg, Pos(0, 0), self.size, key='background', tags=('background',))
         self.drawHelp()
-        self.drawGraph(self.graphInteraction.graph)
+        self.clustered = False
+        self.drawGraph(self.graphInteraction.graph, 'graph')
         if self.isTreeDecomposition:
-            self.drawGraph(self.graphInteraction.graph.originalGraph)
-
-    def drawGraph(self, graph):
-        """Draw the graph"""
-        # The offset for selected vertices
-        selectedVs = self.graphInteraction.selectedVertices
-        offset = self.mousePos - self.mouseDownStartPos if self.mouseDownButton == 1 else Pos(0, 0)
-
-        isTreeDecomposition = type(graph) == TreeDecomposition
-
-        # Draw all edges
-        for v in graph.vertices:
-            for e in v.edges:
-                if v.vid < e.other(v).vid:
-                    ofsA = offset if v in selectedVs else Pos(0, 0)
-                    ofsB = offset if e.other(v) in selectedVs else Pos(0, 0)
-                    pa, pb = v.pos * self.scaleFactor + ofsA, e.other(v).pos * self.scaleFactor + ofsB
-                    self.drawLine(self.colors.edge, pa, pb)
-                    anchor = "nw" if (pa.x < pb.x) != (pa.y < pb.y) else "ne"
-                    if self.settings.drawsize > 0 and not isTreeDecomposition:
-                        self.drawString(str(e.cost), self.colors.hover, 0.5 * (pa + pb) + (0, 2), anchor)
-
-        if self.settings.drawsize > 0:
-            # Draw the hovered vertex
-            isBag = type(self.graphInteraction.hoverVertex) == Bag
-            if self.graphInteraction.hoverVertex and isTreeDecomposition == isBag:
-                r = self.settings.selectradius + (self.settings.bagextra if isBag else 0)
-                ofs = offset if self.graphInteraction.hoverVertex in selectedVs else Pos(0, 0)
-                self.drawDisc(self.colors.hover, self.graphInteraction.hoverVertex.pos * self.scaleFactor + ofs, r)
-
-            # Draw all vertices
-            for v in graph.vertices:
-                # Draw the disc
-                isBag = type(v) == Bag
-                c = self.colors.normal if self.settings.drawsize == 1 else self.colors.hover
-                c = self.colors.selected if v in selectedVs else c
-                r = self.settings.vertexradiussmall if self.settings.drawsize == 1 else self.settings.vertexradiusbig
-                if isBag: r += self.settings.bagextra
-                ofs = offset if v in selectedVs else Pos(0, 0)
-                self.drawDisc(c, v.pos * self.scaleFactor + ofs, r)
-
-                # Draw the text
-                if self.settings.drawsize > 1:
-                    f = (lambda x: chr(x.vid + ord('a'))) if self.settings.drawtext else lambda x: str(x.vid)
-                    bagText = ""
-                    if isBag:
-                        bagText = "\n" if not v.parent else ("\nparent: " + f(v.parent) + "\n")
-                        bagText += "v: " + ' '.join(map(f, v.vertices))
-                    c = self.colors.selectedtext if v in selectedVs else self.colors.text
-                    self.drawString(f(v) + bagText, c, v.pos * self.scaleFactor + ofs, 'c')
+            self.drawGraph(self.graphInteraction.graph.originalGraph, 'original')
+        self.drawnOffset = self.dragOffset
+        self.scene.end()
+
+    def drawChanges(self):
+        """Update the hover disc and the dragged vertices, without going over the rest of the graph"""
+        if not self.drawHover(self.graphInteraction.graph, 'graph') and not (self.isTreeDecomposition
+                and self.drawHover(self.graphInteraction.graph.originalGraph, 'original')):
+            self.eraseItem('hover')
+        if self.mouseDownButton == 1 and self.clustered:
+            # The dragged vertices can move in and out of the clusters
+            self.draw()
+            return
+        if self.mouseDownButton == 1:
+            # Move the selected vertices (and the edges between them) at once, and update the edges leaving the selection
+            offset = self.dragOffset
+            delta = offset - self.drawnOffset
+            self.scene.move('selected', delta.x, delta.y)
+            self.drawnOffset = offset
+            selectedVs = set(self.graphInteraction.selectedVertices)
+            for v in selectedVs:
+                for e in v.edges:
+                    if e.other(v) not in selectedVs:
+                        self.drawEdge(v, e.other(v), e, selectedVs, offset)
+        self.scene.end()
 
     def drawHelp(self):
         """Draw help text"""
         helptext = " Controls:\n-----------\n"
         helptext += self.graphInteraction.keymapToStr()
-        self.drawString(helptext, self.colors.helptext, Pos(10, 10))
+        self.drawString(helptext, self.colors.helptext, Pos(10, 10), key='help', tags=('help',))
 
     def scrollbarClicks(self, p):
         # Manage scrollbar clicks
@@ -144,6 +129,8 @@ class MainWin(Win):
             self.graphInteraction.keymap['LMB']()
             # Hit scrollbar button
             self.scrollbarClicks(p)
+        # The (de)selected vertex has to be tagged before it can be dragged
+        self.redraw()
     def onMouseDownDouble(self, p, btnNr):
         # Check scrollbar (you want to be able to click it multiple times close after eachother)
         if False:
@@ -161,25 +148,20 @@ class MainWin(Win):
     def onMouseMove(self, p, btnNr):
         # Store the old hover vertex
         oldHoverVertex = self.graphInteraction.hoverVertex
-        # Update the hovered vertex
-        self.graphInteraction.hoverVertex = None
-        distance = self.settings.selectradius
-        for v in self.graphInteraction.graph.vertices:
-            if p.distanceSqTo(v.pos) < distance * distance:
-                distance = p.distanceTo(v.pos)
-                self.graphInteraction.hoverVertex = v
-        if self.graphInteraction.graph.originalGraph:
-            distance = self.settings.selectradius + self.settings.bagextra
-            for v in self.graphInteraction.graph.originalGraph.vertices:
-                if p.distanceSqTo(v.pos) < distance * distance:
-                    distance = p.distanceTo(v.pos)
-                    self.graphInteraction.hoverVertex = v
+        # Update the hovered vertex (a vertex of the original graph goes before a bag), using the spatial indices
+        graph = self.graphInteraction.graph
+        hoverVertex = graph.nearestVertex(p, self.settings.selectradius)
+        if graph.originalGraph:
+            hoverVertex = graph.originalGraph.nearestVertex(p, self.settings.selectradius + self.settings.bagextra) or hoverVertex
+        self.graphInteraction.hoverVertex = hoverVertex
         # (De)select vertices
-        if self.mouseDownButton == 3 and oldHoverVertex != self.graphInteraction.hoverVertex:
+        if self.mouseDownButton == 3 and oldHoverVertex != hoverVertex:
             self.graphInteraction.keymap['RMB']()
-        # Update the mouse position
+            self.redraw()
+        # Update the mouse position, only update the canvas if the hovered vertex changed or something is dragged
         self.mousePos = p
-        self.redraw()
+        if oldHoverVertex != hoverVertex or self.mouseDownButton != -1:
+            self.redraw(False)
 
     def onMouseScroll(self, p, factor):
         pass
@@ -229,7 +211,9 @@ class MainWin(Win):
         # Draw if nescessary
         if self.redrawMarker:
             self.draw()
-            self.redrawMarker = False
+        elif self.updateMarker:
+            self.drawChanges()
+        self.redrawMarker, self.updateMarker = False, False
 
     #
     # Scroll images
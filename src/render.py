@@ -0,0 +1,184 @@
+"""
+Headless rendering of graph files to PNG images, without the need for a display.
+Run with `python3 -m src.render graph1.txt graph2.txt ...` in the root directory.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from functools import partial
+from multiprocessing import Pool
+from PIL import Image, ImageDraw, ImageFont
+from .settings import Settings, Pos, Size
+from .drawing import GraphDrawing
+from .graph_interaction import GraphInteraction
+from .graph import *
+from .graph_io import *
+from .tsp import *
+from .decomposition import *
+
+
+class ImageWin(GraphDrawing):
+    """The graph drawn like in the main window, but on a PIL image instead of the Tk canvas (so without tkinter),
+    with the graph scaled to fit the image and the tour on top."""
+    def __init__(self, settings, graph, size, tour=None, margin=40):
+        self.settings = settings
+        self.colors = settings.colors
+        self.pos = Pos(0, 0)
+        self.size = size
+        self.mousePos, self.mouseDownButton, self.mouseDownStartPos = Pos(-1, -1), -1, Pos(-1, -1)
+        self.drawnOffset, self.clustered = Pos(0, 0), False
+        self.graphInteraction = GraphInteraction(self)
+        self.graphInteraction.graph = graph
+        self.graphInteraction.isTreeDecomposition = type(graph) == TreeDecomposition
+        self.tour = tour or []
+
+        self.image = Image.new('RGB', size.t, self.colors.bg)
+        self.imageDraw = ImageDraw.Draw(self.image)
+        try:
+            self.font = ImageFont.truetype('DejaVuSansMono.ttf', 12)
+        except OSError:
+            self.font = ImageFont.load_default()
+        left, top, right, bottom = self.imageDraw.textbbox((0, 0), 'a', font=self.font)
+        settings.fontsize = Size(right - left, bottom - top + 4)
+        self.fit(margin)
+
+    def fit(self, margin):
+        """Set the scale factor and the offset so that all vertices and bags (including their discs) are on the image"""
+        graph = self.graphInteraction.graph
+        vertices = [v for g in [graph, graph.originalGraph] if g for v in g.vertices if v != None]
+        self.scaleFactor, self.offset = 1, Pos(0, 0)
+        if vertices:
+            # The largest disc that is drawn: a bag, a vertex or a cluster
+            radius = self.settings.vertexradiusbig if self.settings.drawsize > 1 else self.settings.vertexradiussmall
+            if any(type(v) == Bag for v in vertices):
+                radius += self.settings.bagextra
+            margin += max(radius, self.settings.clustersize)
+            xs, ys = [v.pos.x for v in vertices], [v.pos.y for v in vertices]
+            w, h = max(max(xs) - min(xs), 1), max(max(ys) - min(ys), 1)
+            self.scaleFactor = max(min((self.size.w - 2 * margin) / w, (self.size.h - 2 * margin) / h), 0)
+            self.offset = Pos(margin - min(xs) * self.scaleFactor, margin - min(ys) * self.scaleFactor)
+
+    def draw(self):
+        """Draw the graph, its tree decomposition and the tour, returns the image"""
+        self.drawGraph(self.graphInteraction.graph, 'graph')
+        if self.isTreeDecomposition:
+            self.drawGraph(self.graphInteraction.graph.originalGraph, 'original')
+        for e in self.tour:
+            self.drawLine(self.colors.tour, e.a.pos * self.scaleFactor, e.b.pos * self.scaleFactor, width=3)
+        return self.image
+
+    def drawGraph(self, graph, layer):
+        if type(graph) == CompleteGraph:
+            # Drawing the edges between all pairs of vertices would only hide the tour
+            for v in graph.vertices:
+                self.drawVertex(v, set(), Pos(0, 0), layer, False)
+        else:
+            GraphDrawing.drawGraph(self, graph, layer)
+
+    def onScreen(self, p, q=None):
+        # Everything fits on the image
+        return True
+
+    def drawItem(self, key, kind, coords, **options):
+        coords = [c + self.offset[i % 2] for i, c in enumerate(coords)]
+        if kind == 'line':
+            self.imageDraw.line(coords, fill=options['fill'], width=options.get('width', 1))
+        elif kind == 'oval':
+            self.imageDraw.ellipse(coords, fill=options['fill'])
+        elif kind == 'rectangle':
+            self.imageDraw.rectangle(coords, fill=options['fill'])
+        elif kind == 'text':
+            # Position the text by its size instead of with PIL anchors, which bitmap fonts don't support
+            text, (x, y), anchor = options['text'], coords, options.get('anchor', 'nw')
+            left, top, right, bottom = self.imageDraw.multiline_textbbox((0, 0), text, font=self.font)
+            if anchor == 'c':
+                x, y = x - (right - left) / 2, y - (bottom - top) / 2
+            elif anchor == 'ne':
+                x -= right - left
+            self.imageDraw.multiline_text((x, y), text, fill=options['fill'], font=self.font)
+
+    def eraseItem(self, key):
+        # Nothing is kept between frames
+        pass
+
+
+def renderGraph(graph, size=Size(1600, 1200), tour=None, settings=None, cluster=False):
+    """Draw the graph (a tree decomposition) and the tour edges on a new PIL image.
+    Unless cluster is set (or other settings are given), every vertex and edge is drawn, also for large graphs."""
+    if settings == None:
+        settings = Settings(False)
+        if len(graph.originalGraph.vertices) > 30:
+            settings.drawtext = False
+            settings.drawsize = 1
+        if not cluster:
+            settings.clusterlimit = sys.maxsize
+    return ImageWin(settings, graph, size, tour).draw()
+
+
+def renderFile(path, directory=None, size=Size(1600, 1200), solve=False, vidStart=1, compact=False, cluster=False):
+    """Render the graph in a file to a PNG image (next to the file, or in the directory if one is given),
+    with the smallest tour if solve is set and the vertices in dense regions clustered if cluster is set.
+    Returns a (json serializable) dictionary with the results."""
+    result = {'file': path}
+    try:
+        startTime = time.perf_counter()
+        graph = readGraph(path, vidStart, compact)
+        result['name'] = graph.name
+        tour = []
+        if solve:
+            if len(graph.vertices) < 1:
+                graph, _ = treeDecomposition(graph.originalGraph)
+            value, tour = TSPSolver(graph).solve()
+            result['cost'] = value if value < sys.maxsize else None
+        target = os.path.join(directory or os.path.dirname(path), os.path.splitext(os.path.basename(path))[0] + '.png')
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        renderGraph(graph, size, tour, cluster=cluster).save(target)
+        result['image'] = target
+        result['time'] = time.perf_counter() - startTime
+    except Exception as e:
+        # One broken file shouldn't stop the entire batch
+        result['error'] = "{}: {}".format(type(e).__name__, e)
+    return result
+
+
+def renderFiles(paths, processes=None, directory=None, size=Size(1600, 1200), solve=False, compact=False, cluster=False):
+    """Render many graph files in a process pool, yields the results in order of completion"""
+    render = partial(renderFile, directory=directory, size=size, solve=solve, compact=compact, cluster=cluster)
+    with Pool(processes) as pool:
+        yield from pool.imap_unordered(render, paths)
+
+
+def main(argv=None):
+    """The entrypoint for the headless renderer"""
+    parser = argparse.ArgumentParser(description="Render many graph + tree decomposition files to PNG images.")
+    parser.add_argument('paths', nargs='+', help="the graph files to render")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="the number of processes (default: all cores)")
+    parser.add_argument('-d', '--directory', default=None,
+                        help="the directory to write the images to (default: next to the graph files)")
+    parser.add_argument('-s', '--size', type=int, nargs=2, default=[1600, 1200], metavar=('WIDTH', 'HEIGHT'),
+                        help="the size of the images in pixels (default: 1600 1200)")
+    parser.add_argument('-t', '--tour', action='store_true',
+                        help="solve the graphs and draw their smallest tours (files without a tree decomposition get a min-fill one)")
+    parser.add_argument('--compact', action='store_true',
+                        help="load the graphs into compact arrays, which uses much less memory for large graphs")
+    parser.add_argument('--cluster', action='store_true',
+                        help="cluster the vertices in dense regions of large graphs like the main window does, instead of drawing every edge")
+    parser.add_argument('-o', '--output', default=None, help="the file to write the results to (default: stdout)")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout if args.output is None else open(args.output, 'w')
+    try:
+        # The results are written as json lines, one line per file
+        for result in renderFiles(args.paths, args.jobs, args.directory, Size(*args.size), args.tour, args.compact, args.cluster):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
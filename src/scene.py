@@ -0,0 +1,85 @@
+"""
+This module contains the Scene class, which keeps the canvas items of a window between redraws
+"""
+
+
+class Scene():
+    """The canvas items of a window by key (like ('vertex', v)), so that a redraw only updates the coordinates and
+    options of the items that changed, instead of deleting and creating all items"""
+    def __init__(self, canvas, layers=()):
+        self.g = canvas
+        self.layers = list(layers) # Tags from bottom to top, new items are put in the right layer
+        self.items = {} # The [item id, kind, coords, options] of every key
+        self.tagged = {} # The keys of the items with a tag
+        self.placed = None # The keys placed since begin, or None if no full frame is drawn
+        self.restack = False
+
+    def __len__(self):
+        return len(self.items)
+
+    def begin(self):
+        """Start a full frame, the items that are not placed again before the end are deleted"""
+        self.placed = set()
+
+    def end(self):
+        """End a (full or partial) frame"""
+        if self.placed != None:
+            for key in [key for key in self.items if key not in self.placed]:
+                self.remove(key)
+            self.placed = None
+        if self.restack:
+            for layer in self.layers:
+                self.g.tag_raise(layer)
+            self.restack = False
+
+    def place(self, key, kind, coords, **options):
+        """Create the item of this kind for the key, or update its coordinates and options if they changed"""
+        if self.placed != None:
+            self.placed.add(key)
+        item = self.items.get(key)
+        if item != None and item[1] != kind:
+            self.remove(key)
+            item = None
+        if item == None:
+            itemId = getattr(self.g, 'create_' + kind)(*coords, **options)
+            self.items[key] = [itemId, kind, coords, options]
+            self.tag(key, options)
+            self.restack = True
+            return itemId
+        if item[2] != coords:
+            self.g.coords(item[0], *coords)
+            item[2] = coords
+        if item[3] != options:
+            self.g.itemconfig(item[0], **options)
+            self.untag(key, item[3])
+            self.tag(key, options)
+            item[3] = options
+            self.restack = True
+        return item[0]
+
+    def move(self, tag, dx, dy):
+        """Move all items with this tag at once"""
+        if not dx and not dy:
+            return
+        self.g.move(tag, dx, dy)
+        for key in self.tagged.get(tag, ()):
+            item = self.items[key]
+            item[2] = tuple(c + (dy if i % 2 else dx) for i, c in enumerate(item[2]))
+
+    def remove(self, key):
+        item = self.items.pop(key, None)
+        if item != None:
+            self.g.delete(item[0])
+            self.untag(key, item[3])
+
+    def clear(self):
+        """Forget all items, the canvas is cleared by the caller"""
+        self.items, self.tagged = {}, {}
+
+    def tag(self, key, options):
+        for t in options.get('tags', ()):
+            self.tagged.setdefault(t, set()).add(key)
+
+    def untag(self, key, options):
+        for t in options.get('tags', ()):
+            self.tagged[t].discard(key)
@@ -1,12 +1,11 @@
 from . import colors
-import tkinter.font
 import math
 
 
 class Settings():
     """The settings class"""
 
-    def __init__(self):
+    def __init__(self, measureFonts=True):
         self.pos = Pos(50, 0)
         self.size = Size(1050, 700)
         self.offset = Pos(40, 20)
@@ -14,17 +13,22 @@ class Settings():
         self.drawsize = 2   # Range is [0, 2]: the larger the value, the larger the vertex size
                             # (with < 2 it also stops drawing edge sizes amoungst others)
         self.drawtext = True
+        self.profile = False # Profile the DP, the counters and timeline are written to <graph name>.json and .trace.json
         self.vidStart = 1 # The id of the first vertex (in the save files - in the program everything starts with 0 of course)
         self.vertexradiussmall = 4      #px
         self.vertexradiusbig = 20       #px
         self.selectradius = 30          #px
         self.bagextra = 35
+        self.clusterlimit = 2000        # With more vertices on the screen, the vertices in dense regions are clustered
+        self.clustersize = 16           #px
         self.scrollbars = 'none'
         self.fps_inv = 1/30             # seconds per frame
         self.colors = colors.Colors()
-        self.calcFontWidths()
+        if measureFonts: # Measuring the font needs a display, without one the fontsize is set by the renderer
+            self.calcFontWidths()
 
     def calcFontWidths(self):
+        import tkinter.font # Only the windows measure fonts, so drawing without a display doesn't need tkinter
         fonts = [tkinter.font.Font(family=fam, size=pt) for fam, pt in [self.font]]
         self.fontsize = Size(fonts[0].measure('a'), fonts[0].metrics("linespace"))
 
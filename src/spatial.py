@@ -0,0 +1,49 @@
+"""
+This module contains a spatial index to find the vertices near a position
+"""
+import math
+
+
+class SpatialIndex():
+    """A uniform grid over the positions of items (vertices or bags), so that finding the nearest item within a radius
+    only looks at the items in the cells that the radius overlaps instead of at all items"""
+    def __init__(self, cellSize):
+        self.cellSize = max(cellSize, 1)
+        self.cells = {} # The set of items in every (non empty) cell, by cell coordinates
+        self.cellOf = {} # The cell coordinates of every item
+
+    def __len__(self):
+        return len(self.cellOf)
+
+    def cell(self, pos):
+        return (math.floor(pos.x / self.cellSize), math.floor(pos.y / self.cellSize))
+
+    def add(self, item, pos):
+        key = self.cell(pos)
+        self.cells.setdefault(key, set()).add(item)
+        self.cellOf[item] = key
+
+    def remove(self, item):
+        key = self.cellOf.pop(item, None)
+        if key != None:
+            self.cells[key].discard(item)
+            if not self.cells[key]:
+                del self.cells[key]
+
+    def move(self, item, pos):
+        """Update the position of an item, it only changes the index if it moves to another cell"""
+        if self.cellOf.get(item) != self.cell(pos):
+            self.remove(item)
+            self.add(item, pos)
+
+    def nearest(self, pos, radius):
+        """The item closest to pos that is less than radius away, or None"""
+        best, bestDistanceSq = None, radius * radius
+        (x0, y0), (x1, y1) = self.cell(pos - (radius, radius)), self.cell(pos + (radius, radius))
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                for item in self.cells.get((x, y), ()):
+                    distanceSq = pos.distanceSqTo(item.pos)
+                    if distanceSq < bestDistanceSq:
+                        best, bestDistanceSq = item, distanceSq
+        return best
@@ -0,0 +1,243 @@
+"""
+This module contains the storage of the DP tables within a memory budget, and their checkpoint files
+"""
+import os
+import sys
+import mmap
+import struct
+import pickle
+import shutil
+import tempfile
+from collections import OrderedDict
+
+# Rough estimates of the memory used per table entry (a packed state and its value) and per backpointer
+ENTRY_BYTES = 100
+BACKPOINTER_BYTES = 200
+
+# The header of a checkpoint file: the magic bytes, the format version, the number of bytes per state and the number of states
+CHECKPOINT_MAGIC = b'TSPT'
+CHECKPOINT_VERSION = 1
+_header = struct.Struct('<4sIIQ')
+_value = struct.Struct('<q')
+
+
+class TableStore():
+    """Keeps track of the DP tables (bag.a) and backpointers (bag.b) of the completed bags of a solve.
+    If the estimated memory use of the tables in memory exceeds the budget (in bytes), the least recently
+    used tables are spilled to files in the directory (default: a temporary one) and loaded again when used."""
+    def __init__(self, budget=None, directory=None):
+        self.budget = budget
+        self.ownsDirectory = budget != None and directory == None
+        self.directory = tempfile.mkdtemp(prefix='tsp-tables-') if self.ownsDirectory else directory
+        self.resident = OrderedDict() # (bag, estimated size) per bag in memory (by vid), least recently used first
+        self.spilled = {} # The bag per spilled bag (by vid)
+        self.pinned = set() # The vids of the bags that are in use, so they can't be spilled
+        self.states = {} # The number of states per completed bag (by vid)
+        self.used, self.peakBytes, self.peakStates, self.residentStates, self.spills = 0, 0, 0, 0, 0
+
+    def use(self, bags):
+        """Make sure the tables of the bags are in memory, they won't be spilled until the next use"""
+        self.pinned = {bag.vid for bag in bags}
+        for bag in bags:
+            if bag.vid in self.spilled:
+                self.load(bag)
+            elif bag.vid in self.resident:
+                self.resident.move_to_end(bag.vid)
+        self.evict()
+
+    def complete(self, bag, kids=(), freeKids=False):
+        """Register the (complete) table of a bag. If freeKids is set, the values of the children are no longer needed,
+        so only their backpointers are kept."""
+        for kid in kids:
+            if freeKids and kid.vid in self.resident:
+                self.forget(kid.vid)
+                kid.a = {}
+                self.remember(kid)
+        self.states[bag.vid] = len(bag.a)
+        self.remember(bag)
+        self.pinned = {bag.vid}
+        self.evict()
+
+    def adopt(self, bag, tables):
+        """Register the tables of a bag completed by another process, see export"""
+        a, b, states = tables
+        self.states[bag.vid] = states
+        if a == None:
+            self.spilled[bag.vid] = bag
+            bag.a = bag.b = None
+        else:
+            bag.a, bag.b = a, b
+            self.remember(bag)
+            self.evict()
+
+    def export(self, bags):
+        """The tables of the bags (or None if they are spilled) and their number of states, to hand them to another process"""
+        return {bag.vid: (bag.a, bag.b, self.states.get(bag.vid, 0)) for bag in bags}
+
+    def evict(self):
+        # Spill the least recently used tables that are not in use until we're within the budget
+        if self.budget == None:
+            return
+        for vid in list(self.resident):
+            if self.used <= self.budget:
+                break
+            if vid not in self.pinned:
+                self.spill(vid)
+
+    def spill(self, vid):
+        # Write the tables of the bag to a file and drop them from memory
+        bag = self.resident[vid][0]
+        with open(self.path(vid), 'wb') as f:
+            pickle.dump((bag.a, bag.b), f, pickle.HIGHEST_PROTOCOL)
+        self.forget(vid)
+        self.spilled[vid] = bag
+        self.spills += 1
+        bag.a = bag.b = None
+
+    def load(self, bag):
+        # Read the spilled tables of the bag back into memory
+        with open(self.path(bag.vid), 'rb') as f:
+            bag.a, bag.b = pickle.load(f)
+        os.remove(self.path(bag.vid))
+        del self.spilled[bag.vid]
+        self.remember(bag)
+
+    def remember(self, bag):
+        # Start tracking the tables of a bag that are in memory
+        # Memory mapped tables are hardly in memory, so they are not counted
+        entries = len(bag.a) if isinstance(bag.a, dict) else 0
+        size = sys.getsizeof(bag.a) + sys.getsizeof(bag.b) + ENTRY_BYTES * entries + BACKPOINTER_BYTES * len(bag.b)
+        self.resident[bag.vid] = (bag, size, entries)
+        self.used += size
+        self.residentStates += entries
+        self.peakBytes = max(self.peakBytes, self.used)
+        self.peakStates = max(self.peakStates, self.residentStates)
+
+    def forget(self, vid):
+        # Stop tracking the tables of a bag that are in memory
+        bag, size, entries = self.resident.pop(vid)
+        self.used -= size
+        self.residentStates -= entries
+
+    def path(self, vid):
+        return os.path.join(self.directory, '{}.pickle'.format(vid))
+
+    def report(self):
+        """The (estimated) peak memory use of the tables, the peak number of states in memory,
+        the size of the largest table and the number of times a table was spilled"""
+        return {'peakBytes': self.peakBytes, 'peakStates': self.peakStates,
+                'largestTable': max(self.states.values(), default=0), 'spills': self.spills}
+
+    def close(self):
+        """Remove the spilled tables from disk, their bags are left without tables"""
+        for vid in list(self.spilled):
+            if os.path.exists(self.path(vid)):
+                os.remove(self.path(vid))
+        self.spilled = {}
+        if self.ownsDirectory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def writeTable(path, table):
+    """Write a DP table to a checkpoint file: the sorted states as big endian integers (all of the same size),
+    followed by their values as 64 bit integers. The file is written under a temporary name first,
+    so an interrupted write never leaves a broken checkpoint behind."""
+    keys = sorted(table)
+    keyBytes = max(1, (max(keys, default=0).bit_length() + 7) // 8)
+    temp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temp, 'wb') as f:
+        f.write(_header.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, keyBytes, len(keys)))
+        f.write(b''.join(S.to_bytes(keyBytes, 'big') for S in keys))
+        f.write(struct.pack('<{}q'.format(len(keys)), *(table[S] for S in keys)))
+    os.replace(temp, path)
+
+
+class MappedTable():
+    """A read only DP table in a checkpoint file (see writeTable). The file is memory mapped, so only the parts
+    that are used are read, and a state is found with a binary search. Only the maps of the most recently used
+    tables are kept open (every map holds a file descriptor), the others are mapped again when they are used."""
+    maxOpen = 64
+    openTables = OrderedDict() # The tables with an open map, least recently used first
+
+    def __init__(self, path):
+        self.path = path
+        self._map = None
+        self.map # Check the header
+
+    @property
+    def map(self):
+        if self._map != None:
+            MappedTable.openTables.move_to_end(self)
+            return self._map
+        with open(self.path, 'rb') as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # The file may have been replaced with one with more states (see writeTable), so read the header again
+        if len(m) < _header.size:
+            m.close()
+            raise ValueError("Not a DP table checkpoint: '{}'".format(self.path))
+        magic, version, self.keyBytes, self.count = _header.unpack_from(m, 0)
+        self.valueStart = _header.size + self.keyBytes * self.count
+        if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION or len(m) != self.valueStart + 8 * self.count:
+            m.close()
+            raise ValueError("Not a DP table checkpoint: '{}'".format(self.path))
+        self._map = m
+        MappedTable.openTables[self] = None
+        while len(MappedTable.openTables) > MappedTable.maxOpen:
+            next(iter(MappedTable.openTables)).close()
+        return m
+
+    def close(self):
+        """Close the map (and its file descriptor), it's mapped again when the table is used"""
+        if self._map != None:
+            MappedTable.openTables.pop(self, None)
+            self._map.close()
+            self._map = None
+
+    def __reduce__(self):
+        # Other processes map the same file
+        return (MappedTable, (self.path,))
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        m = self.map
+        return (self.key(i, m) for i in range(self.count))
+
+    def __contains__(self, S):
+        return self.find(S) >= 0
+
+    def __getitem__(self, S):
+        i = self.find(S)
+        if i < 0:
+            raise KeyError(S)
+        return self.value(i)
+
+    def get(self, S, default=None):
+        i = self.find(S)
+        return default if i < 0 else self.value(i)
+
+    def items(self):
+        m = self.map
+        return ((self.key(i, m), _value.unpack_from(m, self.valueStart + 8 * i)[0]) for i in range(self.count))
+
+    def key(self, i, m=None):
+        start = _header.size + i * self.keyBytes
+        return int.from_bytes((self.map if m == None else m)[start : start + self.keyBytes], 'big')
+
+    def value(self, i):
+        return _value.unpack_from(self.map, self.valueStart + 8 * i)[0]
+
+    def find(self, S):
+        # The index of the state, or -1 if it's not in the table
+        m = self.map
+        if S.bit_length() > 8 * self.keyBytes:
+            return -1
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle, m) < S:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < self.count and self.key(low, m) == S else -1
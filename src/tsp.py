@@ -0,0 +1,902 @@
+"""
+This module contains the dynamic programming algorithm for TSP on tree decompositions
+"""
+import os
+import errno
+import sys
+import time
+import hashlib
+from itertools import combinations
+from multiprocessing import Pool, cpu_count
+from .graph import *
+from .tables import TableStore, MappedTable, writeTable
+from .instrumentation import SolveStats
+from .decomposition import niceTreeDecomposition
+
+
+class BagIndex():
+    """The lookups the DP needs for a bag, precomputed once its parent is known (see TSPSolver.createRoot)"""
+    def __init__(self, Xi, edges):
+        self.edges = edges # The edges between the vertices of the bag, sorted by cost
+        self.local = {v.vid: i for i, v in enumerate(Xi.vertices)} # The index of every vertex (by vid) in the bag
+        self.kids = [e.other(Xi) for e in Xi.edges if e.other(Xi) != Xi.parent]
+        # For every child, whether it contains each vertex of the bag and the (child index, bag index) pairs of the shared vertices
+        self.inKid = [[v in K.vertices for v in Xi.vertices] for K in self.kids]
+        self.shared = [[(p, self.local[v.vid]) for p, v in enumerate(K.vertices) if v.vid in self.local] for K in self.kids]
+
+
+class TSPSolver():
+    """Compute the smallest tour of a graph using DP on its tree decomposition"""
+    def __init__(self, graph, engine='iterative', processes=None, backpointers=True, memoryBudget=None, spillDirectory=None,
+                 checkpointDirectory=None, incremental=False, instrument=False):
+        """The engine is either 'iterative' (the bags are processed in explicit post-order),
+        'parallel' (like iterative, but disjoint subtrees are filled in a pool of processes (default: all cores)),
+        'recursive' (the tables are filled on demand, recursing over the tree)
+        or 'nice' (the DP runs on a nice tree decomposition of the graph, so bags have at most two children).
+        With backpointers, the winning combination of every state is stored, so the tour is read out without
+        recomputing the DP. Without them, less memory is used (the nice engine always stores them).
+        The iterative and parallel engines keep their tables within the memory budget (in bytes, default: unlimited),
+        by spilling tables to files in the spill directory (default: a temporary one), see TableStore.
+        With a checkpoint directory, these engines write every completed table to it (keyed by a hash of the subtree of
+        its bag) and use the memory mapped file from then on. Tables that are already there are reused,
+        so an interrupted solve can be resumed and unchanged subtrees are not solved again.
+        An incremental solver keeps all tables after a solve, the next solve only redoes the bags affected by the
+        edits of the graph since then (and their ancestors).
+        If instrument is set, every solve records counters and timings per bag in stats (see SolveStats)."""
+        if engine not in {'iterative', 'parallel', 'recursive', 'nice'}:
+            raise ValueError("Unknown DP engine: '{}'".format(engine))
+        self.graph = graph
+        self.engine = engine
+        self.processes = processes
+        self.backpointers = backpointers
+        self.tables = TableStore()
+        self.memoryBudget = memoryBudget
+        self.spillDirectory = spillDirectory
+        self.checkpointDirectory = checkpointDirectory
+        self.subtreeHashes = {}
+        self.incremental = incremental
+        self.restored = set() # The vids of the bags whose table is reused (from a checkpoint or the last solve)
+        self.root = None # The root of the last solve
+        self.rootState, self.value = None, sys.maxsize # The state of the root and its value in the last solve
+        self.instrument = instrument
+        self.stats = None
+        self.niceGraph = None
+        # The precomputed lookups per bag (by vid), see createRoot
+        self.bagIndex = {}
+        # The memoized local edge selections per bag (by vid), see tspEdgeSelect
+        self.localCache = {}
+        # The number of bits used per endpoint in the packed DP states (endpoints are stored as vid + 1)
+        self.vidBits = (len(graph.originalGraph.vertices) + 1).bit_length()
+
+        # LOL, this is actually nescessary for (DP on) some graphs (500 vertices)
+        if engine == 'recursive':
+            sys.setrecursionlimit(2000)
+
+    def solve(self, rootBag=None):
+        """Compute the smallest tour, returns its cost and the list of tour edges"""
+        value = self.solveTables(rootBag)
+        return value, self.solveTour()
+
+    def solveTables(self, rootBag=None):
+        """Fill the DP tables, the first half of solve. Returns the cost of the smallest tour."""
+        self.stats = SolveStats() if self.instrument else None
+        if self.engine == 'nice':
+            return self.tspNice(rootBag)
+        if self.incremental and self.root != None and rootBag in {None, self.root} and not self.graph.changedEdges \
+                and not self.graph.structureChanged and not self.graph.originalGraph.structureChanged:
+            Xroot = self.invalidateChanges(self.root)
+        else:
+            Xroot = self.createRoot(rootBag)
+        self.root = Xroot
+        self.graph.clearChanges()
+        self.graph.originalGraph.clearChanges()
+        S = self.rootState = self.fromDegreesEndpoints([2] * len(Xroot.vertices), [])
+        if self.engine == 'recursive':
+            self.value = self.tspTable(S, Xroot)
+        elif self.engine == 'parallel':
+            self.value = self.tspParallel(S, Xroot)
+        else:
+            self.value = self.tspIterative(S, Xroot)
+        return self.value
+
+    def solveTour(self):
+        """Read the smallest tour out of the tables filled by solveTables, the second half of solve.
+        Returns the list of tour edges (empty if there is no tour)."""
+        if self.value >= sys.maxsize:
+            edges = []
+        elif self.engine == 'nice':
+            edges = self.niceTour(self.rootState, self.root)
+        elif self.backpointers:
+            edges = self.tspBacktrack(self.rootState, self.root)
+        else:
+            edges = self.tspReconstruct(self.rootState, self.root)
+        self.tables.close()
+        return edges
+
+    def stateCount(self):
+        """The number of DP states computed in the last solve"""
+        if self.engine in {'iterative', 'parallel'}:
+            return sum(self.tables.states.values())
+        graph = self.niceGraph if self.engine == 'nice' else self.graph
+        return sum(len(bag.a) for bag in graph.vertices if bag.a)
+
+    def tourVertices(self, edges):
+        """Order the edges of a tour, returns the list of vertex ids in tour order"""
+        if not edges:
+            return []
+        neighbours = {}
+        for e in edges:
+            neighbours.setdefault(e.a.vid, []).append(e.b.vid)
+            neighbours.setdefault(e.b.vid, []).append(e.a.vid)
+        tour = [edges[0].a.vid]
+        prev, v = None, edges[0].a.vid
+        while True:
+            nexts = [w for w in neighbours[v] if w != prev]
+            if not nexts or nexts[0] == tour[0] or len(tour) >= len(neighbours):
+                return tour
+            prev, v = v, nexts[0]
+            tour.append(v)
+
+    def tspTable(self, S, Xi):
+        # The smallest value such that all vertices below Xi have degree 2 and vertices in Xi have degrees defined by S
+        debug = False
+        if debug: print("A({} {}, X{}): {}".format(self.toDegrees(S), self.toEndpoints(S), Xi.vid, "?"))
+        self.tables.use([Xi])
+        if S in Xi.a:
+            if debug: print('lookup return: {}'.format(Xi.a[S]))
+            if self.stats: self.stats.count(Xi.vid, 'memoHits')
+            return Xi.a[S]
+        # We don't know this value yet, so we compute it.
+        if self.stats: start = time.perf_counter()
+        edges = self.bagIndex[Xi.vid].edges
+        endpoints = self.toEndpoints(S)
+        value = sys.maxsize
+        for targetDegrees, childDegrees, childEndpoints in self.tspCombinations(Xi, self.toDegrees(S)):
+            val, chosen = self.tspLocalCost(Xi, edges, targetDegrees, endpoints, childEndpoints)
+            if 0 <= val < sys.maxsize:
+                kidStates = self.tspChildStates(Xi, childDegrees, childEndpoints)
+                for Xkid, kidS in kidStates:
+                    val += self.tspTable(kidS, Xkid)
+                if val < value:
+                    value = val
+                    if self.backpointers:
+                        Xi.b[S] = (chosen, tuple(kidS for _, kidS in kidStates))
+        if not isinstance(Xi.a, dict):
+            Xi.a = dict(Xi.a.items()) # A read only table from a checkpoint that doesn't have this state
+        Xi.a[S] = value
+        if self.stats:
+            self.stats.count(Xi.vid, 'states')
+            self.stats.bag(Xi.vid)['tableSize'] = len(Xi.a)
+            self.stats.timed(Xi.vid, 'table', start)
+        if debug: print('calculation return: {}'.format(Xi.a[S]))
+        return Xi.a[S]
+
+    def tspIterative(self, S, Xroot):
+        # Compute the same value as tspTable, but process the bags in explicit (pre- and post-) order instead of recursing.
+        order = self.preOrder(Xroot)
+        options = self.tspRequests(order, {Xroot.vid: {S}})
+        self.tspFillTables(order, options)
+        return Xroot.a[S]
+
+    def tspParallel(self, S, Xroot):
+        # Compute the same value as tspIterative, but fill the tables of disjoint subtrees in a process pool.
+        subtrees = self.scheduleSubtrees(Xroot, 4 * (self.processes or cpu_count()))
+        if len(subtrees) < 2:
+            return self.tspIterative(S, Xroot)
+        # The bags above the subtrees are handled in this process, they also determine the states the subtrees need.
+        order = self.preOrder(Xroot, {X.vid for X in subtrees})
+        requested = {Xroot.vid: {S}}
+        options = self.tspRequests(order, requested)
+        # Hand out the largest subtrees first, so the pool won't end up waiting on one big subtree.
+        tasks = [(X.vid, requested[X.vid]) for X in subtrees if X.vid in requested]
+        with Pool(self.processes, _initWorker, (self,)) as pool:
+            for tables, stats in pool.imap_unordered(_solveSubtree, tasks):
+                for vid, bagTables in tables.items():
+                    self.tables.adopt(self.graph.vertices[vid], bagTables)
+                if stats:
+                    self.stats.merge(stats)
+        self.tspFillTables(order, options)
+        return Xroot.a[S]
+
+    def tspRequests(self, order, requested):
+        # Top down, find all states that are needed and the local costs and child states of their combinations.
+        # The requested states of the bags in order are removed, the states requested from bags below are added.
+        options, stats = {}, self.stats
+        for Xi in order:
+            if Xi.vid in self.restored:
+                continue
+            if stats: start = time.perf_counter()
+            if Xi.vid in requested and self.reuseTables(Xi, requested[Xi.vid]):
+                del requested[Xi.vid]
+                continue
+            if not isinstance(Xi.a, dict):
+                Xi.a = dict(Xi.a.items()) # A table from a checkpoint that doesn't have all requested states
+            edges = self.bagIndex[Xi.vid].edges
+            options[Xi.vid] = {}
+            for S in requested.pop(Xi.vid, ()):
+                endpoints = self.toEndpoints(S)
+                options[Xi.vid][S] = []
+                for targetDegrees, childDegrees, childEndpoints in self.tspCombinations(Xi, self.toDegrees(S)):
+                    val, chosen = self.tspLocalCost(Xi, edges, targetDegrees, endpoints, childEndpoints)
+                    if 0 <= val < sys.maxsize:
+                        kidStates = self.tspChildStates(Xi, childDegrees, childEndpoints)
+                        for Xkid, kidS in kidStates:
+                            kidRequests = requested.setdefault(Xkid.vid, set())
+                            if stats and kidS in kidRequests: stats.count(Xkid.vid, 'memoHits')
+                            kidRequests.add(kidS)
+                        options[Xi.vid][S].append((val, chosen, kidStates))
+            if stats: stats.timed(Xi.vid, 'requests', start)
+        return options
+
+    def tspFillTables(self, order, options):
+        # Bottom up, fill the tables using the (by then complete) tables of the children.
+        debug = False
+        for Xi in reversed(order):
+            if Xi.vid in self.restored:
+                continue
+            if self.stats: start = time.perf_counter()
+            kids = self.bagIndex[Xi.vid].kids
+            self.tables.use(kids)
+            for S, combinations in options.pop(Xi.vid).items():
+                value = sys.maxsize
+                for val, chosen, kidStates in combinations:
+                    for Xkid, kidS in kidStates:
+                        val += Xkid.a[kidS]
+                    if val < value:
+                        value = val
+                        if self.backpointers:
+                            Xi.b[S] = (chosen, tuple(kidS for _, kidS in kidStates))
+                Xi.a[S] = value
+            if self.checkpointDirectory:
+                Xi.a = self.saveCheckpoint(Xi)
+            # With backpointers, the values of the children are not needed anymore (unless we want to reuse them)
+            self.tables.complete(Xi, kids, self.backpointers and not self.incremental)
+            if debug: print('X{}: {} states'.format(Xi.vid, len(Xi.a)))
+            if self.stats:
+                self.stats.count(Xi.vid, 'states', self.tables.states[Xi.vid])
+                self.stats.bag(Xi.vid)['tableSize'] = len(Xi.a)
+                self.stats.timed(Xi.vid, 'fill', start)
+
+    def scheduleSubtrees(self, Xroot, parts):
+        # Split the tree below Xroot into (about) parts disjoint subtrees with about the same estimated work,
+        #   by repeatedly splitting the largest subtree into its children. Returns the roots, largest first.
+        work = {}
+        for Xi in reversed(self.preOrder(Xroot)):
+            kids = self.bagIndex[Xi.vid].kids
+            # The number of states grows with 3^|Xi|, the combinations per state with the number of children
+            work[Xi.vid] = (len(kids) + 1) * 3 ** len(Xi.vertices) + sum(work[X.vid] for X in kids)
+        subtrees = [Xroot]
+        while subtrees:
+            largest = max(subtrees, key=lambda X: work[X.vid])
+            kids = self.bagIndex[largest.vid].kids
+            if not kids or (largest != Xroot and work[largest.vid] * parts <= work[Xroot.vid]):
+                break
+            subtrees.remove(largest)
+            subtrees.extend(kids)
+        return sorted(subtrees, key=lambda X: work[X.vid], reverse=True)
+
+    def tspLocalCost(self, Xi, edges, targetDegrees, endpoints, childEndpoints):
+        # The base cost: the edges needed inside this Xi to account for the (target) degrees we didn't pass on to our children.
+        #   Returns the cost and the indices (in edges) of the edges used.
+        debug = False
+        # Check: all bags (except the root) are not allowed to be a cycle.
+        if not endpoints and Xi.parent:
+            if debug: print('{}All bags should be a cycle - no endpoints given'.format('  ' * len(Xi.vertices)))
+            return sys.maxsize, ()
+        allChildEndpoints = sum(childEndpoints, []) # Flatten the list
+        return self.tspEdgeSelect(Xi, edges, targetDegrees, endpoints, allChildEndpoints)
+
+    def tspChildStates(self, Xi, childDegrees, childEndpoints):
+        # The list of (child bag, state) pairs for this combination of child degrees and child endpoints
+        index = self.bagIndex[Xi.vid]
+        kidStates = []
+        for k, cds in enumerate(childDegrees):
+            Xkid = index.kids[k]
+            # Strip off the vertices not in Xkid and add degrees 2 for vertices not in Xi
+            kidDegrees = [2] * len(Xkid.vertices)
+            for p, q in index.shared[k]:
+                kidDegrees[p] = cds[q]
+            kidStates.append((Xkid, self.fromDegreesEndpoints(kidDegrees, childEndpoints[k])))
+        return kidStates
+
+    def tspChildEvaluation(self, Xi, edges, targetDegrees, childDegrees, endpoints, childEndpoints, resultingEdgeList = None):
+        # Evaluate a complete combination of degrees (i.e. we analyzed the degrees of all vertices):
+        #   return the local cost plus the sum of A values of all children.
+        debug = False
+        val, chosen = self.tspLocalCost(Xi, edges, targetDegrees, endpoints, childEndpoints)
+        if resultingEdgeList != None:
+            resultingEdgeList.extend(edges[j] for j in chosen)
+        if 0 <= val < sys.maxsize:
+            if debug: print('{}Local edge selection cost: {}, edges: {}, degrees: {}, endpoints: {}, edgeList: {}'.format(
+                                            '  ' * len(Xi.vertices), val, edges, targetDegrees, endpoints, resultingEdgeList))
+            for Xkid, S in self.tspChildStates(Xi, childDegrees, childEndpoints):
+                # Add to that base cost the cost of hamiltonian paths nescessary to satisfy the degrees.
+                val += self.tspTable(S, Xkid)
+            if debug: print('{}Min cost for X{} with these child-degrees: {}'.format('  ' * len(Xi.vertices), Xi.vid, val))
+        else:
+            if debug: print('{}No local edge selection found'.format('  ' * len(Xi.vertices)))
+        return val
+
+    def tspReconstruct(self, S, Xroot):
+        # Reconstruct the tsp tour (get a list of all edges), the tables of all bags on the way have to be filled.
+        edgeList = []
+        stack = [(Xroot, S)]
+        while stack:
+            Xi, S = stack.pop()
+            edges, kidStates = self.tspReconstructBag(Xi, S)
+            edgeList += edges
+            stack.extend(kidStates)
+        return edgeList
+
+    def tspReconstructBag(self, Xi, S):
+        # Find the combination with the value in the table of Xi for state S, returns its edges and child states
+        debug = False
+        edges = self.bagIndex[Xi.vid].edges
+        endpoints = self.toEndpoints(S)
+        self.tables.use([Xi])
+        target = Xi.a[S]
+        for targetDegrees, childDegrees, childEndpoints in self.tspCombinations(Xi, self.toDegrees(S)):
+            resultingEdgeList = [] # This list will be filled with the edges used in Xi
+            val = self.tspChildEvaluation(Xi, edges, targetDegrees, childDegrees, endpoints, childEndpoints, resultingEdgeList)
+            if val == target:
+                # So these are indeed the child degrees that we are looking for
+                if debug: print('X{} edgelist: {}'.format(Xi.vid, resultingEdgeList))
+                return resultingEdgeList, self.tspChildStates(Xi, childDegrees, childEndpoints)
+        return [], []
+
+    def tspBacktrack(self, S, Xroot):
+        # Collect the tour edges by following the backpointers of the winning combinations, starting at the root state
+        edgeList = []
+        stack = [(Xroot, S)]
+        while stack:
+            Xi, S = stack.pop()
+            index = self.bagIndex[Xi.vid]
+            self.tables.use([Xi])
+            if S in Xi.b:
+                chosen, kidStates = Xi.b[S]
+                edgeList.extend(index.edges[j] for j in chosen)
+                stack.extend(zip(index.kids, kidStates))
+            else:
+                # Tables from a checkpoint have no backpointers, so find the combination again
+                edges, kidStates = self.tspWinningCombination(Xi, S) or self.tspReconstructBag(Xi, S)
+                edgeList.extend(edges)
+                stack.extend(kidStates)
+        return edgeList
+
+    def tspWinningCombination(self, Xi, S):
+        # Find the combination with the value in the table of Xi for state S using only the states that are in the
+        #   tables of the children (nothing is computed), returns its edges and child states or None if there is none
+        index = self.bagIndex[Xi.vid]
+        endpoints = self.toEndpoints(S)
+        target = Xi.a[S]
+        for targetDegrees, childDegrees, childEndpoints in self.tspCombinations(Xi, self.toDegrees(S)):
+            val, chosen = self.tspLocalCost(Xi, index.edges, targetDegrees, endpoints, childEndpoints)
+            if 0 <= val < sys.maxsize:
+                kidStates = self.tspChildStates(Xi, childDegrees, childEndpoints)
+                values = [Xkid.a.get(kidS) for Xkid, kidS in kidStates]
+                if None not in values and val + sum(values) == target:
+                    return [index.edges[j] for j in chosen], kidStates
+        return None
+
+    def tspCombinations(self, Xi, targetDegrees):
+        # Generate all possible mixes of degrees for all vertices, yields (targetDegrees, childDegrees, childEndpoints)
+        #   i = the vertex we currently analyze, j = the child we currently analyze
+        #   targetDegrees goes from full to empty, childDegrees from empty to full, endpoints are the endpoints for each child path
+        # The yielded lists may be shared between combinations, so they shouldn't be modified.
+        index = self.bagIndex[Xi.vid]
+        n, m, inKid = len(Xi.vertices), len(index.kids), index.inKid
+        stack = [(0, 0, targetDegrees, [[0] * n for _ in index.kids], [[] for _ in index.kids])]
+        while stack:
+            i, j, td, cds, eps = stack.pop()
+            while i < n:
+                # If we can't or didn't want to 'spend' this degree, move on
+                if td[i] == 0 or j >= m:
+                    i, j = i + 1, 0
+                    continue
+                # If the current child does not contain the vertex to analyze, try the next child
+                if not inKid[j][i]:
+                    j += 1
+                    continue
+                break
+            # We have a complete combination
+            if i >= n:
+                yield td, cds, eps
+                continue
+
+            branches = []
+            # If the current degree is 2, try letting the child manage it
+            if td[i] == 2 and cds[j][i] == 0:
+                td2, cds2 = td.copy(), [d.copy() for d in cds]
+                td2[i] = 0
+                cds2[j][i] = 2
+                branches.append((i + 1, 0, td2, cds2, eps))
+            # If the current degree is at least 1 (which it is if we get here),
+            #   try to combine it (for all other vertices) in a hamiltonian path
+            for k in range(i + 1, n):
+                # Stay in {0, 1, 2}
+                if td[k] < 1 or cds[j][k] > 1 or not inKid[j][k]:
+                    continue
+                # Don't add edges twice
+                if self.inEndpoints(eps[j], Xi.vertices[i].vid, Xi.vertices[k].vid):
+                    continue
+                td2, cds2, eps2 = td.copy(), [d.copy() for d in cds], [ep.copy() for ep in eps]
+                td2[i] -= 1
+                cds2[j][i] += 1
+                td2[k] -= 1
+                cds2[j][k] += 1
+                eps2[j].extend([Xi.vertices[nr].vid for nr in [i, k]])
+                # We may have to try to analyze the same vertex again if it's degree is higher than 1
+                branches.append((i, j, td2, cds2, eps2))
+            # Also, try not assigning this degree to anyone, we (maybe) can solve it inside Xi
+            branches.append((i, j + 1, td, cds, eps))
+            # Push them reversed, so they are analyzed in the order above
+            stack.extend(reversed(branches))
+
+    def bagEdges(self, Xi):
+        # The edges between the vertices of Xi, sorted by cost
+        vids = {v.vid for v in Xi.vertices}
+        edges = []
+        for v in Xi.vertices:
+            for e in v.edges:
+                if e.other(v).vid in vids and v.vid < e.other(v).vid:
+                    edges.append(e)
+        edges.sort(key=lambda e: e.cost)
+        return edges
+
+    def tspEdgeSelect(self, Xi, edges, degrees, endpoints, allChildEndpoints):
+        # Calculate the smallest cost to satisfy the degrees target with the edges inside Xi, such that these edges and
+        #   the child paths form the paths between the endpoints (or the tour for the root). Returns the cost and the indices
+        #   of the edges used. The same local problem comes up for many child degree mixes, so the results are memoized per bag.
+        key = (tuple(degrees), self.canonicalPairs(endpoints), self.canonicalPairs(allChildEndpoints))
+        cache = self.localCache.setdefault(Xi.vid, {})
+        if self.stats:
+            self.stats.count(Xi.vid, 'edgeSelects')
+            self.stats.count(Xi.vid, 'localHits', key in cache)
+        if key not in cache:
+            cache[key] = self.tspEdgeSearch(Xi, edges, degrees, endpoints, allChildEndpoints)
+        return cache[key]
+
+    def tspEdgeSearch(self, Xi, edges, degrees, endpoints, allChildEndpoints):
+        # Branch and bound over the edges (sorted by cost), returns the smallest cost and the indices of the edges used.
+        #   A branch is cut off if a vertex can't get its degree from the edges left, if the cheapest edges left can't
+        #   improve on the best selection so far, or if an edge closes a cycle that is not the complete tour
+        #   or completes a path that doesn't connect a pair of endpoints.
+        local = self.bagIndex[Xi.vid].local
+        ends = [(local[e.a.vid], local[e.b.vid]) for e in edges]
+        remaining = list(degrees)
+        if sum(remaining) % 2 == 1:
+            return sys.maxsize, ()
+        # The number of edges of both vertices after every edge, and the cost of the cheapest edges from every index
+        later, counts = [None] * len(edges), [0] * len(remaining)
+        for j in range(len(edges) - 1, -1, -1):
+            a, b = ends[j]
+            later[j] = (counts[a], counts[b])
+            counts[a] += 1
+            counts[b] += 1
+        if any(d > c for d, c in zip(remaining, counts)):
+            return sys.maxsize, ()
+        prefix = [0]
+        for e in edges:
+            prefix.append(prefix[-1] + e.cost)
+
+        # The paths formed so far (by the child paths and the chosen edges), as the other end of every path end.
+        #   A vertex that is an endpoint of two paths is split in two path ends: vid for its first edge, ~vid for its second.
+        #   At the root, a cycle may only be closed by the last edge and only if there are no other paths.
+        isRoot = not endpoints
+        required = self.canonicalPairs(endpoints)
+        appearances = {}
+        for vid in endpoints:
+            appearances[vid] = appearances.get(vid, 0) + 1
+        split = {vid for vid, count in appearances.items() if count == 2}
+        partner = {}
+        def join(a, b):
+            # Add a path between a and b, returns whether it closed a cycle, the ends of the path and how to undo it
+            if a in split and a in partner: a = ~a
+            if b in split and b in partner: b = ~b
+            undo = [(v, partner.get(v)) for v in {a, b, partner.get(a, a), partner.get(b, b)}]
+            if partner.get(a) == b:
+                del partner[a], partner[b]
+                return True, None, undo
+            endA, endB = partner.pop(a, a), partner.pop(b, b)
+            partner[endA], partner[endB] = endB, endA
+            return False, (endA, endB), undo
+        def restore(undo):
+            for v, p in undo:
+                if p == None:
+                    partner.pop(v, None)
+                else:
+                    partner[v] = p
+        def finished(end):
+            # Whether no more edges can be added to this path end
+            return end < 0 or end in split or remaining[local[end]] == 0
+        def pair(a, b):
+            a, b = (a if a >= 0 else ~a), (b if b >= 0 else ~b)
+            return (a, b) if a < b else (b, a)
+        closed = False
+        for j in range(0, len(allChildEndpoints), 2):
+            if closed:
+                if self.stats: self.stats.count(Xi.vid, 'rejections')
+                return sys.maxsize, ()
+            closed, _, _ = join(allChildEndpoints[j], allChildEndpoints[j + 1])
+        if closed and (not isRoot or partner or any(remaining)):
+            if self.stats: self.stats.count(Xi.vid, 'rejections')
+            return sys.maxsize, ()
+
+        best, chosen = [sys.maxsize, ()], []
+        def search(j, need, cost, closed):
+            # Choose need more edges from the edges from index j on
+            if need == 0:
+                # The paths should be exactly the ones between the endpoints, or the root should have closed the tour
+                if isRoot:
+                    valid = closed
+                else:
+                    valid = tuple(sorted(pair(a, b) for a, b in partner.items() if a < b)) == required
+                if valid and cost < best[0]:
+                    best[0], best[1] = cost, tuple(chosen)
+                return
+            if j + need > len(edges) or cost + prefix[j + need] - prefix[j] >= best[0]:
+                return
+            a, b = ends[j]
+            laterA, laterB = later[j]
+            # Take the edge, unless it closes a cycle too early or completes a path that isn't between endpoints
+            if remaining[a] > 0 and remaining[b] > 0 and remaining[a] <= laterA + 1 and remaining[b] <= laterB + 1:
+                remaining[a] -= 1
+                remaining[b] -= 1
+                closes, path, undo = join(edges[j].a.vid, edges[j].b.vid)
+                if closes:
+                    allowed = isRoot and need == 1 and not partner
+                else:
+                    allowed = not (finished(path[0]) and finished(path[1])) or pair(*path) in required
+                if allowed:
+                    chosen.append(j)
+                    search(j + 1, need - 1, cost + edges[j].cost, closes)
+                    chosen.pop()
+                restore(undo)
+                remaining[a] += 1
+                remaining[b] += 1
+            # Skip the edge
+            if remaining[a] <= laterA and remaining[b] <= laterB:
+                search(j + 1, need, cost, closed)
+        search(0, sum(remaining) // 2, 0, closed)
+        if self.stats: self.stats.count(Xi.vid, 'rejections', best[0] == sys.maxsize)
+        return best[0], best[1]
+
+    def canonicalPairs(self, endpoints):
+        # The pairs of a list of endpoints, independent of their order and direction
+        pairs = [(a, b) if a < b else (b, a) for a, b in zip(endpoints[::2], endpoints[1::2])]
+        pairs.sort()
+        return tuple(pairs)
+
+    def toDegrees(self, S):
+        # From a packed integer representation to a list of degrees
+        degrees = []
+        while S & 3 != 3:
+            degrees.append(S & 3)
+            S >>= 2
+        return degrees
+
+    def toEndpoints(self, S):
+        # From a packed integer representation to a list of endpoints (vertex ids)
+        while S & 3 != 3:
+            S >>= 2
+        S >>= 2
+        endpoints, mask = [], (1 << self.vidBits) - 1
+        while S:
+            endpoints.append((S & mask) - 1)
+            S >>= self.vidBits
+        return endpoints
+
+    def fromDegreesEndpoints(self, degrees, endpoints):
+        # From a list of degrees and endpoints to a packed integer representation.
+        # The lowest bits contain two bits per degree, followed by the separator 3 (a degree is at most 2),
+        #   followed by vidBits bits per endpoint. As the endpoints are stored as vid + 1, the highest one is never 0.
+        S = 0
+        for vid in reversed(endpoints):
+            S = (S << self.vidBits) | (vid + 1)
+        S = (S << 2) | 3
+        for d in reversed(degrees):
+            S = (S << 2) | d
+        return S
+
+    def createRoot(self, rootBag=None):
+        """Make the tree decomposition a true tree, by choosing a root and setting all parent pointers correctly.
+        The tables of all bags are reset and their lookups for the DP are precomputed."""
+        self.newTables()
+        self.vidBits = (len(self.graph.originalGraph.vertices) + 1).bit_length()
+        # Choose the first bag as root if none is given
+        if rootBag == None:
+            rootBag = self.graph.vertices[0]
+        # Set the parent for all bags, walking down the tree with an explicit stack
+        rootBag.parent = None
+        stack = [rootBag]
+        while stack:
+            bag = stack.pop()
+            bag.a, bag.b = {}, {}
+            self.localCache.pop(bag.vid, None)
+            for e in bag.edges:
+                child = e.other(bag)
+                if bag.parent != child:
+                    child.parent = bag
+                    stack.append(child)
+            self.bagIndex[bag.vid] = BagIndex(bag, self.bagEdges(bag))
+        if self.checkpointDirectory:
+            self.hashSubtrees(rootBag)
+        return rootBag
+
+    def invalidateChanges(self, Xroot):
+        # Reset the tables of the bags affected by the edits of the graph since the last solve (those containing both
+        #   vertices of a changed edge or with changed vertices) and those of their ancestors, keep the other tables.
+        self.newTables()
+        changedEdges = self.graph.originalGraph.changedEdges
+        dirty = set()
+        for Xi in self.preOrder(Xroot):
+            local = self.bagIndex[Xi.vid].local
+            if Xi.vid in self.graph.changedVertices or Xi.a == None or any(a in local and b in local for a, b in changedEdges):
+                while Xi != None and Xi.vid not in dirty:
+                    dirty.add(Xi.vid)
+                    Xi = Xi.parent
+        for vid in dirty:
+            Xi = self.graph.vertices[vid]
+            Xi.a, Xi.b = {}, {}
+            self.localCache.pop(vid, None)
+            self.bagIndex[vid] = BagIndex(Xi, self.bagEdges(Xi))
+        if self.checkpointDirectory:
+            self.hashSubtrees(Xroot)
+        return Xroot
+
+    def newTables(self):
+        # Start a new table store, the reuse of tables is decided again
+        self.tables.close()
+        self.tables = TableStore(self.memoryBudget, self.spillDirectory)
+        self.restored = set()
+
+    def hashSubtrees(self, Xroot):
+        # The content hash of the subtree of every bag: its vertices (in order, as the states depend on it), the costs
+        #   of its edges, whether it's the root and the hashes of its children, as these determine its table.
+        self.subtreeHashes = {}
+        for Xi in reversed(self.preOrder(Xroot)):
+            index = self.bagIndex[Xi.vid]
+            content = (self.vidBits, Xi.parent == None, [v.vid for v in Xi.vertices],
+                       [(e.a.vid, e.b.vid, e.cost) for e in index.edges], sorted(self.subtreeHashes[X.vid] for X in index.kids))
+            self.subtreeHashes[Xi.vid] = hashlib.sha1(repr(content).encode()).hexdigest()
+
+    def checkpointPath(self, Xi):
+        return os.path.join(self.checkpointDirectory, '{}.table'.format(self.subtreeHashes[Xi.vid]))
+
+    def saveCheckpoint(self, Xi):
+        # Write the (complete) table of Xi to its checkpoint file, returns the memory mapped table.
+        #   The states that are already in the file are kept, as the checkpoints of parents written before may need them.
+        path, table = self.checkpointPath(Xi), Xi.a
+        if os.path.exists(path):
+            try:
+                old = MappedTable(path)
+                table = dict(old.items())
+                table.update(Xi.a)
+                old.close()
+            except (OSError, ValueError) as e:
+                if isinstance(e, OSError) and e.errno in (errno.EMFILE, errno.ENFILE):
+                    raise # Out of file descriptors, not a broken checkpoint
+                table = Xi.a
+        writeTable(path, table)
+        return MappedTable(path)
+
+    def reuseTables(self, Xi, states):
+        # Reuse the tables of the subtree of Xi if the table of Xi has all requested states, returns whether they are used.
+        #   These are the tables of the last solve (for an incremental solver) or the ones from the checkpoints.
+        if self.incremental and Xi.a and all(S in Xi.a for S in states):
+            self.restored.update(X.vid for X in self.preOrder(Xi))
+            return True
+        return self.checkpointDirectory != None and self.restoreCheckpoints(Xi, states)
+
+    def restoreCheckpoints(self, Xi, states):
+        # Use the checkpoints of the subtree of Xi if they all exist, the table of Xi has all requested states and the
+        #   tables below it have the child states of their winning combinations, returns whether they are used.
+        #   The tables below Xi are only used to reconstruct the tour.
+        subtree = self.preOrder(Xi)
+        if not all(os.path.exists(self.checkpointPath(X)) for X in subtree):
+            return False
+        try:
+            tables = [MappedTable(self.checkpointPath(X)) for X in subtree]
+        except (OSError, ValueError) as e:
+            if isinstance(e, OSError) and e.errno in (errno.EMFILE, errno.ENFILE):
+                raise # Out of file descriptors, not a broken checkpoint
+            return False
+        if not all(S in tables[0] for S in states):
+            return False
+        previous = [X.a for X in subtree]
+        for X, table in zip(subtree, tables):
+            X.a = table
+        if not self.checkpointsComplete(Xi, states):
+            for X, table in zip(subtree, previous):
+                X.a = table
+            return False
+        self.restored.update(X.vid for X in subtree)
+        return True
+
+    def checkpointsComplete(self, Xi, states):
+        # Whether the tour can be read out of the (restored) tables below Xi for all states, without computing anything
+        stack, seen = [(Xi, S) for S in states], set()
+        while stack:
+            Xi, S = stack.pop()
+            if (Xi.vid, S) in seen or Xi.a[S] >= sys.maxsize:
+                continue
+            seen.add((Xi.vid, S))
+            combination = self.tspWinningCombination(Xi, S)
+            if combination == None:
+                return False
+            stack.extend(combination[1])
+        return True
+
+    def preOrder(self, Xroot, skip=()):
+        # The bags in the subtree of Xroot in pre-order, so every bag comes before its children.
+        #   The subtrees of the bags with a vid in skip are left out.
+        order, stack = [], [Xroot]
+        while stack:
+            Xi = stack.pop()
+            order.append(Xi)
+            stack.extend(X for X in self.bagIndex[Xi.vid].kids if X.vid not in skip)
+        return order
+
+    def inEndpoints(self, endpoints, start, end):
+        # Return whether or not this combination of endpoints (or reversed order) is already in the endpoints list
+        for j in range(0, len(endpoints), 2):
+            if (endpoints[j] == start and endpoints[j + 1] == end) or (endpoints[j + 1] == start and endpoints[j] == end):
+                return True
+        return False
+
+    #
+    # DP on nice tree decompositions
+    #
+    def tspNice(self, rootBag=None):
+        # Compute the smallest tour on a nice tree decomposition of the graph, returns its cost (see niceTour for the tour).
+        #   The tables are filled bottom up, every bag only combines the states of (at most two) children,
+        #   a state is the degree of every bag vertex and the pairs of endpoints of the paths (canonically sorted).
+        #   Every edge is chosen when the first of its vertices is forgotten, the tour is closed only if that's the last edge.
+        self.niceGraph = niceTreeDecomposition(self.graph, rootBag)
+        Xroot = self.createRoot(self.niceGraph.vertices[0])
+        n = len(self.graph.originalGraph.vertices)
+        forgotten = {}
+        for Xi in reversed(self.preOrder(Xroot)):
+            if self.stats: start = time.perf_counter()
+            Xi.b = {}
+            kids = self.bagIndex[Xi.vid].kids
+            forgotten[Xi.vid] = sum(forgotten[X.vid] for X in kids)
+            if not kids:
+                self.niceLeaf(Xi)
+            elif len(kids) == 2:
+                self.niceJoin(Xi, kids[0], kids[1], forgotten[Xi.vid] + len(Xi.vertices) == n)
+            elif len(Xi.vertices) == len(kids[0].vertices) + 1:
+                self.niceIntroduce(Xi, kids[0])
+            elif len(Xi.vertices) == len(kids[0].vertices) - 1:
+                forgotten[Xi.vid] += 1
+                self.niceForget(Xi, kids[0], forgotten[Xi.vid] + len(Xi.vertices) == n)
+            else:
+                raise ValueError("X{} is not a bag of a nice tree decomposition".format(Xi.vid))
+            if self.stats:
+                self.stats.count(Xi.vid, 'states', len(Xi.a))
+                self.stats.bag(Xi.vid)['tableSize'] = len(Xi.a)
+                self.stats.timed(Xi.vid, 'nice', start)
+
+        self.root, self.rootState = Xroot, self.niceEncode(Xroot, {}, {})
+        self.value = Xroot.a.get(self.rootState, sys.maxsize)
+        return self.value
+
+    def niceTour(self, S, Xroot):
+        # Reconstruct the tour by following the choices made in every bag
+        edgeList, stack = [], [(Xroot, S)]
+        while stack:
+            Xi, S = stack.pop()
+            kidStates, edges = Xi.b[S]
+            edgeList += edges
+            kids = self.bagIndex[Xi.vid].kids
+            stack.extend(zip(kids, kidStates))
+        return edgeList
+
+    def niceLeaf(self, Xi):
+        # A leaf has no edges yet, so all its vertices (if any) have degree 0
+        S = self.niceEncode(Xi, {v.vid: 0 for v in Xi.vertices}, {})
+        Xi.a[S] = 0
+        Xi.b[S] = ((), ())
+
+    def niceIntroduce(self, Xi, Xkid):
+        # The introduced vertex has no edges yet, so all states get degree 0 for it
+        v = [v for v in Xi.vertices if v not in Xkid.vertices][0]
+        for kidS, val in Xkid.a.items():
+            degree, partner = self.niceDecode(Xkid, kidS)
+            degree[v.vid] = 0
+            S = self.niceEncode(Xi, degree, partner)
+            Xi.a[S] = val
+            Xi.b[S] = ((kidS,), ())
+
+    def niceForget(self, Xi, Xkid, isComplete):
+        # The forgotten vertex must get degree 2, using edges to the other vertices in the child bag
+        v = [v for v in Xkid.vertices if v not in Xi.vertices][0]
+        neighbours = [e for e in v.edges if e.other(v) in Xkid.vertices]
+        for kidS, val in Xkid.a.items():
+            degree, partner = self.niceDecode(Xkid, kidS)
+            for edges in combinations(neighbours, 2 - degree[v.vid]):
+                d, p = dict(degree), dict(partner)
+                if not self.niceAddPaths(d, p, [(v.vid, e.other(v).vid) for e in edges], isComplete):
+                    continue
+                del d[v.vid]
+                self.niceUpdate(Xi, self.niceEncode(Xi, d, p), val + sum(e.cost for e in edges), (kidS,), edges)
+
+    def niceJoin(self, Xi, Xleft, Xright, isComplete):
+        # The degrees of both children are added and the paths of the right child are added to those of the left child
+        rights = []
+        for S, val in Xright.a.items():
+            degree, partner = self.niceDecode(Xright, S)
+            inner = [vid for vid, d in degree.items() if d == 2]
+            paths = [(a, b) for a, b in partner.items() if a < b]
+            rights.append((S, val, inner, paths))
+        for leftS, leftVal in Xleft.a.items():
+            degree, partner = self.niceDecode(Xleft, leftS)
+            for rightS, rightVal, inner, paths in rights:
+                if any(degree[vid] != 0 for vid in inner):
+                    continue
+                d, p = dict(degree), dict(partner)
+                for vid in inner:
+                    d[vid] = 2
+                if not self.niceAddPaths(d, p, paths, isComplete):
+                    continue
+                self.niceUpdate(Xi, self.niceEncode(Xi, d, p), leftVal + rightVal, (leftS, rightS), ())
+
+    def niceUpdate(self, Xi, S, val, kidStates, edges):
+        # Store the value if it's better than what we found for this state so far
+        if val < Xi.a.get(S, sys.maxsize):
+            Xi.a[S] = val
+            Xi.b[S] = (kidStates, tuple(edges))
+
+    def niceAddPaths(self, degree, partner, paths, isComplete):
+        # Add the paths (or edges) between the given pairs of vertices, returns whether this is allowed.
+        #   A cycle may only be closed if it's the complete tour, i.e. all vertices are in this subtree and have degree 2.
+        closed = False
+        for a, b in paths:
+            if degree[a] > 1 or degree[b] > 1 or closed:
+                return False
+            if partner.get(a) == b:
+                del partner[a], partner[b]
+                closed = True
+            else:
+                endA, endB = partner.pop(a, a), partner.pop(b, b)
+                partner[endA], partner[endB] = endB, endA
+            degree[a] += 1
+            degree[b] += 1
+        if closed:
+            return isComplete and not partner and all(d == 2 for d in degree.values())
+        return True
+
+    def niceDecode(self, Xi, S):
+        # From a packed state to a dictionary with the degree per vid and one with the other endpoint of every path end
+        degree = {v.vid: d for v, d in zip(Xi.vertices, self.toDegrees(S))}
+        endpoints = self.toEndpoints(S)
+        partner = {}
+        for j in range(0, len(endpoints), 2):
+            partner[endpoints[j]], partner[endpoints[j + 1]] = endpoints[j + 1], endpoints[j]
+        return degree, partner
+
+    def niceEncode(self, Xi, degree, partner):
+        # From the degree and partner dictionaries to a packed state, with the endpoint pairs sorted
+        endpoints = []
+        for a, b in sorted((a, b) for a, b in partner.items() if a < b):
+            endpoints += [a, b]
+        return self.fromDegreesEndpoints([degree[v.vid] for v in Xi.vertices], endpoints)
+
+
+#
+# Parallel workers
+#
+def _initWorker(solver):
+    # Every worker process gets its own copy of the solver (and thus the graph and the parent pointers)
+    global _workerSolver
+    _workerSolver = solver
+
+def _solveSubtree(task):
+    # Fill the tables of the subtree below the bag with the given vid, returns the tables of all its bags (and the stats)
+    vid, requested = task
+    if _workerSolver.instrument:
+        _workerSolver.stats = SolveStats()
+    Xi = _workerSolver.graph.vertices[vid]
+    order = _workerSolver.preOrder(Xi)
+    _workerSolver.tspFillTables(order, _workerSolver.tspRequests(order, {vid: requested}))
+    return _workerSolver.tables.export(order), _workerSolver.stats
@@ -1,11 +1,22 @@
+import io
+import os
+import json
 import sys
-from random import randrange
+import tempfile
+import subprocess
+from random import Random, randrange
 
 from .mainwin import *
 from .graph import *
 from .graph_interaction import *
+from .tsp import *
 from .settings import *
 from .colors import *
+from .generators import *
+from .benchmark import bruteForceCost
+from .decomposition import treeDecomposition
+from .graph_io import parseGraph, graphLines, writeGraph, writeBinary, readBinary
+from .render import ImageWin
 
 
 class UnitTests():
@@ -14,10 +25,27 @@ class UnitTests():
         """Init runs unit tests"""
         self.graphInteraction = GraphInteraction(mainWin)
         self.graphInteraction.openFileWithPath("graph-unittests.txt")
+        self.solver = TSPSolver(self.graphInteraction.graph)
         self.errors = []
 
         self.testToFromDegrees()
         self.testDPBaseCases()
+        self.testNiceDP()
+        self.testIncrementalDP()
+        self.testCheckpointEdits()
+        self.testCheckpointDescriptors()
+        self.testMemoryBudget()
+        self.testSolveStats()
+        self.testGeneratedGraphs()
+        self.testDecompositionHeuristics()
+        self.testCompactGraph()
+        self.testRemoveVertices()
+        self.testTsplib()
+        self.testBinaryFormat()
+        self.testWriteGraph()
+        self.testSpatialIndex()
+        self.testScene()
+        self.testRender()
 
         if (self.errors):
             print('\nThe unit tests have {} errors:'.format(len(self.errors)))
@@ -38,42 +66,324 @@ class UnitTests():
         for i in range(tries):
             length = randrange(2, 20)
             degrees = [randrange(0, 3) for _ in range(length)]
-            S = self.graphInteraction.fromDegreesEndpoints(degrees, [])
-            result = self.graphInteraction.toDegrees(S)
+            S = self.solver.fromDegreesEndpoints(degrees, [])
+            result = self.solver.toDegrees(S)
             if result != degrees:
                 self.error('To/from degrees - degrees: {}, S: {}, result degrees: {}'.format(degrees, S, result))
 
     def testDPBaseCases(self):
         # Test some base cases for tsp
         # def tspTable(self, S, Xi): -
-        gi = self.graphInteraction
-        gi.createRoot()
+        dp = self.solver
+        dp.createRoot()
 
         # Test case 0 - Invalid case (tspTable)
-        S = gi.fromDegreesEndpoints([2, 0, 2], [])
-        Xi = gi.graph.vertices[1]
-        val = self.graphInteraction.tspTable(S, Xi)
+        S = dp.fromDegreesEndpoints([2, 0, 2], [])
+        Xi = dp.graph.vertices[1]
+        val = dp.tspTable(S, Xi)
         if val < sys.maxsize:
             self.error('DP test case 0 - val: {}'.format(val))
 
         # Test case 1 - Valid leaf case (tspTable)
-        S = gi.fromDegreesEndpoints([1, 2, 1], [2, 4])
-        Xi = gi.graph.vertices[2]
-        val = self.graphInteraction.tspTable(S, Xi)
+        S = dp.fromDegreesEndpoints([1, 2, 1], [2, 4])
+        Xi = dp.graph.vertices[2]
+        val = dp.tspTable(S, Xi)
         if val != 18:
             self.error('DP test case 1 - val: {}'.format(val))
 
         # Test case 2 - Valid case (tspTable)
-        S = gi.fromDegreesEndpoints([1, 1, 2], [1, 4])
-        Xi = gi.graph.vertices[1]
-        val = self.graphInteraction.tspTable(S, Xi)
+        S = dp.fromDegreesEndpoints([1, 1, 2], [1, 4])
+        Xi = dp.graph.vertices[1]
+        val = dp.tspTable(S, Xi)
         if val != 38: # 19 + 11 + 8
             self.error('DP test case 2 - val: {}'.format(val))
 
         # Test case 3 - checking endpoints membership
         eps = [1, 2, 1, 5, 3, 4]
-        if gi.inEndpoints(eps, 5, 3):
+        if dp.inEndpoints(eps, 5, 3):
             self.error('Endpoints membership test case 3 - false positive')
-        if not gi.inEndpoints(eps, 1, 5):
+        if not dp.inEndpoints(eps, 1, 5):
             self.error('Endpoints membership test case 3 - false negative')
 
+    def testNiceDP(self):
+        # Test if the DP on the nice tree decomposition finds the same tour cost
+        value, edges = TSPSolver(self.graphInteraction.graph, 'nice').solve()
+        if value != 75:
+            self.error('Nice DP - val: {}'.format(value))
+        if len(edges) != len(self.graphInteraction.graph.originalGraph.vertices):
+            self.error('Nice DP - tour edges: {}'.format(edges))
+
+    def testIncrementalDP(self):
+        # Test if solving again after changing an edge cost gives the same result as solving from scratch
+        graph = self.graphInteraction.graph
+        solver = TSPSolver(graph, incremental=True)
+        solver.solve()
+        graph.originalGraph.removeEdge(2, 3)
+        graph.originalGraph.addEdge(2, 3, 20)
+        value, edges = solver.solve()
+        fresh = TSPSolver(graph)
+        if value != fresh.solve()[0]:
+            self.error('Incremental DP - val: {}'.format(value))
+        if solver.stateCount() >= fresh.stateCount():
+            self.error('Incremental DP - states: {} (from scratch: {})'.format(solver.stateCount(), fresh.stateCount()))
+        graph.originalGraph.removeEdge(2, 3)
+        graph.originalGraph.addEdge(2, 3, 9)
+
+    def testCheckpointEdits(self):
+        # Test if solving with the same checkpoint directory while removing and adding edges gives the same results as
+        # solving from scratch (a checkpoint of a subtree that's back to an earlier state must have the states it needs)
+        td = kTreeGraph(6, 3, seed=138)
+        edges = [(e.a.vid, e.b.vid, e.cost) for v in td.originalGraph.vertices for e in v.edges if e.a.vid < e.b.vid]
+        rnd, removed = Random(138), {}
+        with tempfile.TemporaryDirectory() as directory:
+            for i in range(6):
+                try:
+                    value = TSPSolver(td, checkpointDirectory=directory).solve()[0]
+                except TypeError as e:
+                    self.error('Checkpoint edits - solve {}: {}'.format(i, e))
+                    return
+                if value != TSPSolver(td).solve()[0]:
+                    self.error('Checkpoint edits - solve {}, val: {}, from scratch: {}'.format(i, value, TSPSolver(td).solve()[0]))
+                a, b, cost = rnd.choice(edges)
+                if (a, b) in removed:
+                    td.originalGraph.addEdge(a, b, removed.pop((a, b)))
+                else:
+                    td.originalGraph.removeEdge(a, b)
+                    removed[a, b] = cost
+
+    def testCheckpointDescriptors(self):
+        # Test if resuming from checkpoints works for a tree decomposition with more bags than the process may open files
+        # (the memory mapped tables must not keep a file descriptor each)
+        try:
+            import resource
+        except ImportError:
+            return # Not on this platform
+        td = seriesParallelGraph(400, seed=1)
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(256, soft), hard))
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                value = TSPSolver(td, checkpointDirectory=directory).solve()[0]
+                solver = TSPSolver(td, checkpointDirectory=directory)
+                resumed, edges = solver.solve()
+                if resumed != value or sum(e.cost for e in edges) != value or len(solver.restored) != len(td.vertices):
+                    self.error('Checkpoint descriptors - val: {} (first solve: {}), restored: {} of {} bags'.format(
+                        resumed, value, len(solver.restored), len(td.vertices)))
+        except OSError as e:
+            self.error('Checkpoint descriptors - {}'.format(e))
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+    def testMemoryBudget(self):
+        # Test if solving within a tiny memory budget (so the tables are spilled to disk) gives the same result as without
+        for td in [gridGraph(3, 4, seed=1), kTreeGraph(10, 3, seed=1)]:
+            solver = TSPSolver(td, memoryBudget=1)
+            value, edges = solver.solve()
+            if value != TSPSolver(td).solve()[0] or sum(e.cost for e in edges) != value:
+                self.error('Memory budget - {} val: {}, from scratch: {}'.format(td.name, value, TSPSolver(td).solve()[0]))
+            if solver.tables.report()['spills'] == 0:
+                self.error('Memory budget - {} tables: {}'.format(td.name, solver.tables.report()))
+
+    def testSolveStats(self):
+        # Test if an instrumented solve counts the states of every bag, and if its timeline is a valid Chrome trace
+        td = kTreeGraph(10, 3, seed=1)
+        solver = TSPSolver(td, instrument=True)
+        solver.solve()
+        counted = {vid: counters['states'] for vid, counters in solver.stats.bags.items() if counters['states']}
+        if counted != {vid: n for vid, n in solver.tables.states.items() if n} or solver.stats.totals()['states'] != solver.stateCount():
+            self.error('Solve stats - states: {}, state count: {}'.format(counted, solver.stateCount()))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'trace.json')
+            solver.stats.writeChromeTrace(path)
+            with open(path) as f:
+                trace = json.load(f)
+        if not trace.get('traceEvents') or any(event['ph'] != 'X' or event['dur'] < 0 for event in trace['traceEvents']):
+            self.error('Solve stats - trace: {}'.format(trace))
+
+    def testGeneratedGraphs(self):
+        # Test if the DP finds the optimal tour on small generated graphs with their natural tree decompositions
+        for td in [gridGraph(2, 4, seed=1), kTreeGraph(10, 3, seed=1), seriesParallelGraph(10, seed=1)]:
+            value, edges = TSPSolver(td).solve()
+            best = bruteForceCost(td.originalGraph)
+            if value != best:
+                self.error('Generated graphs - {} val: {}, brute force: {}'.format(td.name, value, best))
+            if value < sys.maxsize and sum(e.cost for e in edges) != value:
+                self.error('Generated graphs - {} tour edges: {}'.format(td.name, edges))
+            # The parallel engine solves disjoint subtrees in a process pool (the grid is too small to split)
+            parallelValue, parallelEdges = TSPSolver(td, 'parallel', processes=2).solve()
+            if parallelValue != value or sum(e.cost for e in parallelEdges) != value:
+                self.error('Generated graphs - {} parallel val: {}, iterative: {}'.format(td.name, parallelValue, value))
+
+    def testDecompositionHeuristics(self):
+        # Test if the heuristics give valid tree decompositions (a tree in which every edge is in a bag and the bags
+        # containing a vertex are connected), with the right width, on which the DP finds the optimal tour
+        for generated in [kTreeGraph(10, 3, seed=2), euclideanGraph(9, seed=2), gridGraph(3, 3, seed=2)]:
+            graph = generated.originalGraph
+            for heuristic in ['min-degree', 'min-fill']:
+                td, width = treeDecomposition(graph, heuristic)
+                name = '{} {}'.format(generated.name, heuristic)
+                bags = [{v.vid for v in bag.vertices} for bag in td.vertices]
+                if sum(len(bag.edges) for bag in td.vertices) != 2 * (len(bags) - 1):
+                    self.error('Decomposition heuristics - {} is not a tree'.format(name))
+                for v in graph.vertices:
+                    for e in v.edges:
+                        if not any({e.a.vid, e.b.vid} <= bag for bag in bags):
+                            self.error('Decomposition heuristics - {} edge {} not in a bag'.format(name, e))
+                    containing = {vid for vid, bag in enumerate(bags) if v.vid in bag}
+                    reached, stack = set(), list(containing)[:1]
+                    while stack:
+                        bag = td.vertices[stack.pop()]
+                        reached.add(bag.vid)
+                        stack.extend(e.other(bag).vid for e in bag.edges if e.other(bag).vid in containing - reached)
+                    if not containing or reached != containing:
+                        self.error('Decomposition heuristics - {} bags of {}: {}'.format(name, v.vid, sorted(containing)))
+                if width != max(len(bag) for bag in bags) - 1:
+                    self.error('Decomposition heuristics - {} width: {}, bags: {}'.format(name, width, bags))
+                value, best = TSPSolver(td).solve()[0], bruteForceCost(graph)
+                if value != best:
+                    self.error('Decomposition heuristics - {} val: {}, brute force: {}'.format(name, value, best))
+
+    def testCompactGraph(self):
+        # Test if a compact copy of the graph has the same edges and gives the same tour cost
+        graph = self.graphInteraction.graph
+        compact = CompactGraph.fromGraph(graph.originalGraph)
+        for v in graph.originalGraph.vertices:
+            for e in v.edges:
+                if compact.cost(v.vid, e.other(v).vid) != e.cost:
+                    self.error('Compact graph - cost of {}: {}'.format(e, compact.cost(v.vid, e.other(v).vid)))
+        td = TreeDecomposition(compact)
+        for bag in graph.vertices:
+            copy = Bag(td, bag.vid, bag.pos)
+            copy.vertices = [compact.vertices[v.vid] for v in bag.vertices]
+            td.addVertex(copy)
+        for bag in graph.vertices:
+            for e in bag.edges:
+                td.addEdge(e.a.vid, e.b.vid, 1)
+        value, edges = TSPSolver(td).solve()
+        if value != 75:
+            self.error('Compact graph - val: {}'.format(value))
+
+    def testRemoveVertices(self):
+        # Test if removing vertices in a batch keeps the remaining vertices and edges, with consecutive vids
+        graph = gridGraph(4, 4, seed=1).originalGraph
+        corner, edges = graph.vertices[15], len(graph.vertices[14].edges)
+        remap = graph.removeVertices([graph.vertices[vid] for vid in [0, 5, 10]])
+        if [v.vid for v in graph.vertices] != list(range(13)) or corner.vid != 12 or remap.get(15) != 12:
+            self.error('Remove vertices - vids: {}, remap: {}'.format([v.vid for v in graph.vertices], remap))
+        if len(graph.vertices[11].edges) != edges - 1 or graph.cost(11, 12) == sys.maxsize:
+            self.error('Remove vertices - edges of 14: {}'.format(list(graph.vertices[11].edges)))
+
+    def testTsplib(self):
+        # Test if TSPLIB files without edges are read as complete graphs, with explicit or implied costs
+        lines = ["NAME: tiny", "DIMENSION: 4", "EDGE_WEIGHT_TYPE: EXPLICIT", "EDGE_WEIGHT_FORMAT: UPPER_ROW",
+                 "EDGE_WEIGHT_SECTION", "3 4 2", "4 6", "5", "EOF"]
+        graph = parseGraph(lines).originalGraph
+        costs = [graph.cost(a, b) for a, b in [(0, 1), (2, 0), (3, 0), (1, 2), (3, 1), (2, 3)]]
+        if costs != [3, 4, 2, 4, 6, 5] or len(graph.vertices[0].edges) != 3:
+            self.error('TSPLIB explicit - costs: {}'.format(costs))
+        lines = ["NAME : euclidean", "DIMENSION : 3", "EDGE_WEIGHT_TYPE : EUC_2D", "NODE_COORD_SECTION",
+                 "1 0 0", "2 3.0 4.0", "3 6.2 8", "DEPOT_SECTION", "1", "-1", "EOF"]
+        graph = parseGraph(lines).originalGraph
+        if graph.cost(0, 1) != 5 or graph.cost(0, 2) != 10 or graph.depots != [0]:
+            self.error('TSPLIB EUC_2D - costs: {}, {}, depots: {}'.format(graph.cost(0, 1), graph.cost(0, 2), graph.depots))
+
+    def testBinaryFormat(self):
+        # Test if writing a graph in the binary format and reading it again gives the same graph and tour cost
+        graph = self.graphInteraction.graph
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'graph.gtb')
+            writeBinary(graph, path)
+            for mapped in [True, False]:
+                copy = readBinary(path, mapped)
+                if sorted(graphLines(copy)) != sorted(graphLines(graph)):
+                    self.error('Binary format - lines: {}'.format(list(graphLines(copy))))
+                value, edges = TSPSolver(copy).solve()
+                if value != 75:
+                    self.error('Binary format - val: {}'.format(value))
+
+    def testWriteGraph(self):
+        # Test if the streaming writer writes the same graph in small chunks as in one go
+        graph = self.graphInteraction.graph
+        chunked, whole = io.StringIO(), io.StringIO()
+        writeGraph(graph, chunked, chunkLines=3)
+        writeGraph(graph, whole)
+        if chunked.getvalue() != whole.getvalue() or whole.getvalue().splitlines() != list(graphLines(graph)):
+            self.error('Write graph - text: {}'.format(chunked.getvalue()))
+        copy = parseGraph(io.StringIO(whole.getvalue()))
+        if TSPSolver(copy).solve()[0] != 75:
+            self.error('Write graph - val: {}'.format(TSPSolver(copy).solve()[0]))
+
+    def testSpatialIndex(self):
+        # Test if the spatial index finds the same nearest vertex as a linear scan, also after moving and removing vertices
+        graph = euclideanGraph(200, seed=3).originalGraph
+        def linearNearest(p, radius):
+            candidates = [v for v in graph.vertices if p.distanceSqTo(v.pos) < radius * radius]
+            return min(candidates, key=lambda v: p.distanceSqTo(v.pos), default=None)
+        distance = lambda p, v: None if v == None else p.distanceSqTo(v.pos) # Equally close vertices are both fine
+        rnd = Random(22)
+        points = [Pos(rnd.randrange(0, 800), rnd.randrange(0, 800)) for i in range(100)]
+        for step in range(3):
+            for p in points:
+                if distance(p, graph.nearestVertex(p, 40)) != distance(p, linearNearest(p, 40)):
+                    self.error('Spatial index - step {}, pos: {}, vertex: {}'.format(step, p, graph.nearestVertex(p, 40)))
+                    return
+            graph.vertices[7].pos = Pos(400, 400)
+            graph.removeVertex(graph.vertices[11])
+        # Aligning vertices on the grid moves them in the index as well
+        u, v = graph.vertices[0], graph.vertices[1]
+        u.pos, v.pos = Pos(118, 100), Pos(121, 300) # v moves to the cell of u
+        selected, self.graphInteraction.selectedVertices = self.graphInteraction.selectedVertices, [u, v]
+        self.graphInteraction.gridAdjust()
+        self.graphInteraction.selectedVertices = selected
+        index = graph.spatialIndex
+        if v.pos != (119, 300) or index.cellOf[v] != index.cell(v.pos):
+            self.error('Spatial index - grid adjust: {} in cell {}'.format(v.pos, index.cellOf[v]))
+
+    def testScene(self):
+        # Test if the scene only creates, moves, changes and deletes the canvas items that changed between frames
+        class Canvas():
+            def __init__(self):
+                self.calls, self.count = [], 0
+            def create_line(self, *coords, **options):
+                self.calls.append('create')
+                self.count += 1
+                return self.count
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: self.calls.append(name)
+        canvas = Canvas()
+        scene = Scene(canvas, ['edge'])
+        def frame(lines):
+            canvas.calls = []
+            scene.begin()
+            for key, coords, fill in lines:
+                scene.place(key, 'line', coords, fill=fill, tags=('edge',))
+            scene.end()
+            return canvas.calls
+        lines = [(i, (i, 0, i, 10), 'white') for i in range(100)]
+        results = [frame(lines).count('create'), frame(lines)]
+        lines[3], lines[5] = (3, (3, 0, 3, 20), 'white'), (5, (5, 0, 5, 10), 'black')
+        results += [frame(lines), frame(lines[1:]), len(scene)]
+        if results != [100, [], ['coords', 'itemconfig', 'tag_raise'], ['delete'], 99]:
+            self.error('Scene - calls: {}'.format(results))
+
+    def testRender(self):
+        # Test if the offscreen renderer fits the graph on the image and draws the tour on top
+        graph = self.graphInteraction.graph
+        value, tour = TSPSolver(graph).solve()
+        settings = Settings(False)
+        win = ImageWin(settings, graph, Size(600, 400), tour)
+        image = win.draw()
+        p = 0.5 * (tour[0].a.pos + tour[0].b.pos) * win.scaleFactor + win.offset
+        if image.size != (600, 400) or image.getpixel((int(p.x), int(p.y))) != win.colors.toTuple(win.colors.tour):
+            self.error('Render - size: {}, pixel: {}'.format(image.size, image.getpixel((int(p.x), int(p.y)))))
+        r = settings.vertexradiusbig + settings.bagextra
+        for bag in graph.vertices:
+            p = bag.pos * win.scaleFactor + win.offset
+            if not (r <= p.x <= 600 - r and r <= p.y <= 400 - r):
+                self.error('Render - bag {} at {} is cut off'.format(bag.vid, p))
+        # The renderer is used without a display, so it must not need tkinter
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, '-c', "import sys; sys.modules['tkinter'] = None; import src.render"],
+                                cwd=root, capture_output=True, text=True)
+        if result.returncode != 0:
+            self.error('Render - import without tkinter: {}'.format(result.stderr.strip().splitlines()[-1:]))
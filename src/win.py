@@ -7,9 +7,11 @@ from tkinter import *
 from PIL import Image, ImageTk, ImageDraw
 from .settings import *
 from .colors import *
+from .scene import Scene
+from .drawing import Drawing
 
 
-class Win:
+class Win(Drawing):
     """Abstract window class"""
 
     def __init__(self, settings, app, pos):
@@ -20,6 +22,7 @@ class Win:
         self.g = app.canvas
         self.pos = pos
         self.size = Size(50, 50) # Should be set in the resize method
+        self.scene = Scene(self.g)
 
     def enable(self):
         """Enable this window."""
@@ -63,22 +66,15 @@ class Win:
         """This draw method needs to be overridden to draw the window content."""
         pass
 
-    # Some draw methods to make sure all my subclasses don't have to bother about tkinters canvas
-    def drawString(self, text, c, p, anchor='nw'):
-        self.g.create_text((self.pos + p).t, anchor=anchor, text=text, fill=c, font=self.settings.font)
+    # The draw methods (see Drawing) draw on tkinters canvas
+    # Items drawn with a key are kept by the scene and only updated when they change, the others are drawn every time
+    def drawItem(self, key, kind, coords, **options):
+        if key == None:
+            return getattr(self.g, 'create_' + kind)(*coords, **options)
+        return self.scene.place(key, kind, coords, **options)
 
-    def drawLine(self, c, p, q, w=1):
-        self.g.create_line((self.pos + p).t, (self.pos + q).t, fill=c)
-        # TODO: Use width
-    def drawHorizontalLine(self, c, h, w=1):
-        self.drawLine(c, Pos(0, h), Pos(self.size.w, h), w)
-
-    def drawRect(self, c, p, s):
-        self.drawRectBorder(c, p, s, 0)
-    def drawRectBorder(self, c, p, s, borderw=1):
-        self.g.create_rectangle((self.pos + p).t, (self.pos + p + s).t, fill=c, width=borderw)
-    def drawDisc(self, c, p, r, **kwargs):
-        self.g.create_oval(p.x-r, p.y-r, p.x+r, p.y+r, fill=c, outline="", **kwargs)
+    def eraseItem(self, key):
+        self.scene.remove(key)
 
     def loadImgPIL(self, path):
         return Image.open('img/' + path)
@@ -92,6 +88,7 @@ class Win:
 
     def fullClear(self):
         self.g.delete(ALL)
+        self.scene.clear()
         self.clear(self.colors.bg)
     def clear(self, c):
         self.drawRect(c, Pos(0, 0), self.size)